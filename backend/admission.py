@@ -0,0 +1,162 @@
+# backend/admission.py
+
+"""Admission control: per-upstream concurrency limits with bounded wait queues.
+
+Every call to a slow or quota-limited upstream (the Gemini agent, Custom Search,
+Speech-to-Text, Text-to-Speech and Translate) goes through an ``UpstreamLimiter``.
+A limiter admits at most ``max_concurrency`` callers at once, lets at most
+``max_queue`` more wait, and gives up on a waiter after ``max_wait`` seconds.
+Overflow raises ``OverloadedError`` so the API can answer immediately with a
+429/503 and a Retry-After header instead of letting work pile up.
+"""
+
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict
+
+from backend import metrics
+from backend.config import settings
+
+
+class OverloadedError(Exception):
+    """Raised when an upstream limiter cannot admit a caller."""
+
+    def __init__(self, upstream: str, reason: str, retry_after: int):
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+        # A full queue means the client is sending faster than we can serve (429);
+        # a timed-out wait means we are the bottleneck right now (503).
+        self.status_code = 429 if reason == "queue_full" else 503
+        super().__init__(f"Upstream '{upstream}' is overloaded ({reason}).")
+
+
+class UpstreamLimiter:
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._in_flight = 0
+        self._rejected = {"queue_full": 0, "wait_timeout": 0}
+
+    def _reject(self, reason: str) -> OverloadedError:
+        self._rejected[reason] += 1
+        metrics.incr(f"admission.{self.name}.rejected.{reason}")
+        return OverloadedError(self.name, reason, settings.overload_retry_after_seconds)
+
+    async def acquire(self, max_wait: float = None) -> None:
+        """Waits for a concurrency slot; every successful call must be paired with ``release``."""
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            raise self._reject("queue_full")
+
+        timeout = self.max_wait if max_wait is None else min(self.max_wait, max_wait)
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=max(timeout, 0))
+        except asyncio.TimeoutError:
+            raise self._reject("wait_timeout")
+        finally:
+            self._waiting -= 1
+        self._in_flight += 1
+
+    def release(self) -> None:
+        self._in_flight -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self, max_wait: float = None):
+        """Holds one concurrency slot for the duration of the ``async with`` block."""
+        await self.acquire(max_wait)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "queue_depth": self._waiting,
+            "max_queue": self.max_queue,
+            "rejected": dict(self._rejected),
+        }
+
+
+_limiters: Dict[str, UpstreamLimiter] = {
+    "interaction": UpstreamLimiter(
+        "interaction", settings.interaction_max_concurrency,
+        settings.interaction_max_queue, settings.interaction_max_wait_seconds,
+    ),
+    "agent": UpstreamLimiter(
+        "agent", settings.agent_max_concurrency,
+        settings.upstream_max_queue, settings.upstream_max_wait_seconds,
+    ),
+    "cse": UpstreamLimiter(
+        "cse", settings.cse_max_concurrency,
+        settings.upstream_max_queue, settings.upstream_max_wait_seconds,
+    ),
+    "stt": UpstreamLimiter(
+        "stt", settings.stt_max_concurrency,
+        settings.upstream_max_queue, settings.upstream_max_wait_seconds,
+    ),
+    "tts": UpstreamLimiter(
+        "tts", settings.tts_max_concurrency,
+        settings.upstream_max_queue, settings.upstream_max_wait_seconds,
+    ),
+    "translate": UpstreamLimiter(
+        "translate", settings.translate_max_concurrency,
+        settings.upstream_max_queue, settings.upstream_max_wait_seconds,
+    ),
+}
+
+# Blocking SDK calls (STT/TTS/Translate) get their own thread pool, sized to the sum
+# of their limits, so they can never starve the default executor used elsewhere.
+_blocking_executor = ThreadPoolExecutor(
+    max_workers=settings.stt_max_concurrency + settings.tts_max_concurrency + settings.translate_max_concurrency,
+    thread_name_prefix="kisan-upstream",
+)
+
+
+def limiter(upstream: str) -> UpstreamLimiter:
+    return _limiters[upstream]
+
+
+async def run_blocking(upstream: str, func: Callable, *args, **kwargs):
+    """Runs a blocking upstream call in the dedicated pool under the upstream's limit.
+
+    A thread can't be interrupted. If the caller stops waiting (a deadline
+    expired), the slot is released only when the thread finishes. The limiter
+    then never reports capacity that the executor doesn't have.
+    """
+    upstream_limiter = limiter(upstream)
+    await upstream_limiter.acquire()
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    future = loop.run_in_executor(_blocking_executor, call)
+
+    def finished(done: asyncio.Future) -> None:
+        upstream_limiter.release()
+        if not done.cancelled():
+            done.exception()  # retrieved, so an abandoned call's error isn't logged as unhandled
+
+    future.add_done_callback(finished)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        if not future.done():
+            metrics.incr(f"admission.{upstream}.abandoned")
+        raise
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    return {name: lim.stats() for name, lim in _limiters.items()}
+
+
+metrics.register_collector("admission", stats)
@@ -0,0 +1,187 @@
+# backend/advisories.py
+
+"""Daily per-district advisory digests, precomputed before the morning peak.
+
+Most weather and price questions on a given morning are the same for every
+farmer in a district. Once a day, at ``settings.advisory_run_hour`` (IST),
+one API process claims the run, and for every district with registered
+users it:
+
+1. gathers the weather, key crop prices and active schemes with the
+   existing tool functions,
+2. has the model condense them into a short digest,
+3. translates the digest into each configured language (one list request
+   per language for all districts), and
+4. stores the results in ``district_advisories``.
+
+The run is marked finished only once the digests are stored. Until then the
+other processes check back every ``settings.advisory_retry_minutes``. If the
+claiming process crashes or restarts, another one retakes the claim once it
+is ``settings.advisory_claim_stale_minutes`` old. A run that fails releases
+its claim and is retried at the next check. A district that fails is
+skipped; the rest of the run carries on.
+
+``get_gemini_response`` injects the digest for the user's district, so the
+agent can answer common questions without calling tools live.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+from backend import ai_services, admission, gazetteer, metrics, translation_services, database as db
+from backend.cache import TTLCache
+from backend.config import settings
+from backend.utils import get_language_codes
+
+IST = ZoneInfo("Asia/Kolkata")
+
+_scheduler = None
+# district_id:language -> digest text, so serving a digest costs no database round trip.
+_digest_cache = TTLCache(ttl_seconds=600, max_entries=4096)
+
+
+def _languages() -> List[str]:
+    return [name.strip() for name in settings.advisory_languages.split(",") if name.strip()]
+
+
+def _crops() -> List[str]:
+    return [crop.strip() for crop in settings.advisory_crops.split(",") if crop.strip()]
+
+
+async def _generate_english_digest(district_id: str, schemes: str) -> Optional[str]:
+    district_name = gazetteer.display_name(district_id)
+    weather, *prices = await asyncio.gather(
+        ai_services.get_weather_advisory(district_id),
+        *(ai_services.get_market_prices(crop, district_id) for crop in _crops()),
+    )
+    sections = [result["content"] for result in [weather, *prices] if result.get("status") == "success"]
+    if not sections:
+        return None
+    if schemes:
+        sections.append(schemes)
+    return await ai_services.summarize_advisory(district_name, "\n\n".join(sections))
+
+
+async def generate_advisories() -> Dict[str, int]:
+    """Generates and stores today's digests for all active districts."""
+    started = time.monotonic()
+    districts = await asyncio.to_thread(db.get_active_district_ids)
+    try:
+        schemes_result = await ai_services.get_government_schemes(settings.advisory_schemes_topic)
+    except Exception as e:
+        print(f"Advisory schemes lookup failed: {e}")
+        schemes_result = {}
+    schemes = schemes_result["content"] if schemes_result.get("status") == "success" else ""
+
+    semaphore = asyncio.Semaphore(settings.advisory_concurrency)
+
+    async def one(district_id: str):
+        async with semaphore:
+            district_started = time.monotonic()
+            try:
+                return district_id, await _generate_english_digest(district_id, schemes)
+            except Exception as e:
+                print(f"Advisory for {district_id} skipped: {e}")
+                metrics.incr("advisories.district_failed")
+                return district_id, None
+            finally:
+                metrics.observe("advisories.district_seconds", time.monotonic() - district_started)
+
+    english = {d: digest for d, digest in await asyncio.gather(*(one(d) for d in districts)) if digest}
+
+    rows = [(district_id, "English", digest) for district_id, digest in english.items()]
+    district_ids = list(english)
+    for language in _languages():
+        target = get_language_codes(language)["translate"]
+        if target == "en" or not district_ids:
+            continue
+        try:
+            translated = await admission.run_blocking(
+                "translate", translation_services.translate_texts, [english[d] for d in district_ids], target
+            )
+        except Exception as e:
+            print(f"Advisory translation to {language} failed: {e}")
+            continue
+        rows.extend((district_id, language, text) for district_id, text in zip(district_ids, translated))
+
+    if not await asyncio.to_thread(db.save_district_advisories, rows):
+        raise RuntimeError("could not store the advisories")
+    elapsed = time.monotonic() - started
+    metrics.observe("advisories.generation_seconds", elapsed)
+    metrics.incr("advisories.generated", len(rows))
+    print(f"Generated {len(rows)} advisories for {len(english)}/{len(districts)} districts in {elapsed:.1f}s.")
+    return {"districts": len(districts), "digests": len(rows)}
+
+
+def get_digest(location_id: Optional[str], language: str = "English") -> Optional[str]:
+    """Returns the current digest for the district containing ``location_id``, if fresh enough."""
+    place = gazetteer.resolve(location_id) if location_id else None
+    if place is None or place.district_id is None:
+        return None
+    language = language.split(" ")[0]  # "Hindi (हिन्दी)" -> "Hindi", as in settings.advisory_languages
+    key = f"{place.district_id}:{language}"
+    digest = _digest_cache.get(key)
+    if digest is None:
+        digest = db.get_district_advisory(place.district_id, language, settings.advisory_max_age_hours) or ""
+        _digest_cache.set(key, digest)
+    return digest or None
+
+
+def _seconds_until_next_run() -> float:
+    now = datetime.now(IST)
+    next_run = now.replace(hour=settings.advisory_run_hour, minute=0, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+
+async def _run_if_claimed(run_date) -> None:
+    # Several API processes run the scheduler; only the one holding today's claim generates.
+    if not await asyncio.to_thread(db.claim_advisory_run, run_date, settings.advisory_claim_stale_minutes):
+        return
+    try:
+        await generate_advisories()
+    except Exception:
+        await asyncio.to_thread(db.release_advisory_run, run_date)
+        raise
+    await asyncio.to_thread(db.finish_advisory_run, run_date)
+
+
+async def _scheduler_loop() -> None:
+    while True:
+        now = datetime.now(IST)
+        if now.hour >= settings.advisory_run_hour:
+            run_date = now.date()
+            try:
+                await _run_if_claimed(run_date)
+                finished = await asyncio.to_thread(db.is_advisory_run_finished, run_date)
+            except Exception as e:
+                # Never let an error (e.g. a missing table) end the loop; try again later.
+                print(f"Advisory generation failed: {e}")
+                metrics.incr("advisories.run_failed")
+                finished = False
+            if not finished:
+                # Still running elsewhere, or failed: check back, and retake the claim once it is stale.
+                await asyncio.sleep(settings.advisory_retry_minutes * 60)
+                continue
+        await asyncio.sleep(_seconds_until_next_run())
+
+
+def start_scheduler() -> None:
+    global _scheduler
+    if _scheduler is None and settings.advisories_enabled:
+        _scheduler = asyncio.create_task(_scheduler_loop())
+
+
+async def stop_scheduler() -> None:
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.cancel()
+        await asyncio.gather(_scheduler, return_exceptions=True)
+        _scheduler = None
+
+
+metrics.register_collector("advisories", db.get_advisory_freshness)
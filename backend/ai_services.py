@@ -1,42 +1,214 @@
 # backend/ai_services.py
 
-import google.generativeai as genai
-from agno.agent import Agent
-from agno.models.google import Gemini
-from agno.storage.postgres import PostgresStorage
-from agno.media import Image
+# agno and the Gemini SDK take seconds to import, so they are imported on first
+# use inside the functions below rather than when the API worker boots.
 from textwrap import dedent
 from backend.config import settings
+from backend import admission, deadlines, gazetteer, market_prices, metrics, quota, database as db
+from backend.cache import TTLCache
 import json
 from typing import Dict, Any, Optional
 import logging
 import httpx
 import asyncio
-from datetime import datetime
-from functools import lru_cache
+from datetime import date, datetime, timedelta
+from functools import lru_cache, wraps
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import deque
+import time
 
 # --- CONFIGURATION ---
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# --- TOOL CALL DEDUPLICATION ---
+# Inside a tool_call_memo() block (one batch of queries), identical tool calls share a
+# single in-flight result instead of each hitting Custom Search.
+
+_tool_call_memo: ContextVar[Optional[Dict[Any, asyncio.Future]]] = ContextVar("kisan_tool_call_memo", default=None)
+
+@contextmanager
+def tool_call_memo():
+    token = _tool_call_memo.set({})
+    try:
+        yield
+    finally:
+        _tool_call_memo.reset(token)
+
+def _memo_key(tool_name: str, args: tuple, kwargs: Dict[str, Any]) -> tuple:
+    normalize = lambda value: " ".join(value.lower().split()) if isinstance(value, str) else value
+    return (tool_name, tuple(normalize(a) for a in args), tuple(sorted((k, normalize(v)) for k, v in kwargs.items())))
+
+def coalesce_within_batch(tool):
+    @wraps(tool)
+    async def wrapper(*args, **kwargs):
+        memo = _tool_call_memo.get()
+        if memo is None:
+            return await tool(*args, **kwargs)
+        key = _memo_key(tool.__name__, args, kwargs)
+        future = memo.get(key)
+        if future is None:
+            future = memo[key] = asyncio.ensure_future(tool(*args, **kwargs))
+        else:
+            metrics.incr("batch.tool_calls_deduplicated")
+        return await asyncio.shield(future)
+    return wrapper
+
 # --- ASYNCHRONOUS TOOL IMPLEMENTATIONS ---
 
+# Tool results keyed by canonical IDs (district for weather, normalized topic for schemes).
+_weather_cache = TTLCache(ttl_seconds=settings.weather_cache_ttl_seconds)
+_schemes_cache = TTLCache(ttl_seconds=settings.schemes_cache_ttl_seconds)
+
+CSE_URL = "https://www.googleapis.com/customsearch/v1"
+
+# Recent Custom Search latencies, used to pick the hedging delay (p95).
+_cse_latencies = deque(maxlen=200)
+
+def _cse_hedge_delay() -> float:
+    if len(_cse_latencies) < 20:
+        return settings.cse_hedge_default_delay_seconds
+    ordered = sorted(_cse_latencies)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    return max(p95, settings.cse_hedge_min_delay_seconds)
+
+async def _cse_get(client: httpx.AsyncClient, params: Dict[str, Any]) -> Dict[str, Any]:
+    started = time.monotonic()
+    response = await client.get(CSE_URL, params=params)
+    response.raise_for_status()
+    _cse_latencies.append(time.monotonic() - started)
+    return response.json()
+
+async def _cse_search_hedged(client: httpx.AsyncClient, params: Dict[str, Any], tool: str) -> Dict[str, Any]:
+    """Sends the query, and an identical second one if the first is slower than p95."""
+    primary = asyncio.ensure_future(_cse_get(client, params))
+    tasks = [primary]
+    # Whatever ends this call (an answer, an error, or the deadline cancelling it),
+    # no request may outlive the client it was sent on.
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=_cse_hedge_delay())
+        if done:
+            return primary.result()
+
+        # The hedge costs a query too; without quota to spare, just keep waiting.
+        try:
+            await quota.acquire(tool)
+        except quota.QuotaExhausted:
+            return await primary
+        metrics.incr("cse.hedged_requests")
+        tasks.append(asyncio.ensure_future(_cse_get(client, params)))
+        pending = set(tasks)
+        last_error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+        raise last_error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()  # a losing request's error is expected, not unhandled
+
+async def _cse_search(params: Dict[str, Any], tool: str) -> Dict[str, Any]:
+    """Runs one Custom Search query for ``tool`` within the current interaction's deadline.
+
+    Each query that is sent is paid for from the shared daily quota (see
+    ``backend.quota``), which raises ``quota.QuotaExhausted`` when the tool may not spend any more.
+    Custom Search is idempotent, so when hedging is enabled a slow query is
+    duplicated after the p95 delay and whichever answer arrives first wins.
+    """
+    async def search():
+        async with admission.limiter("cse").slot():
+            # Spent only once the query is about to go out: a refused slot or a
+            # deadline that runs out in the queue costs no quota.
+            await quota.acquire(tool)
+            async with httpx.AsyncClient(timeout=settings.cse_timeout_seconds) as client:
+                try:
+                    if settings.cse_hedging_enabled:
+                        result = await _cse_search_hedged(client, params, tool)
+                    else:
+                        result = await _cse_get(client, params)
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code == 429:
+                        try:
+                            body = e.response.json()
+                        except ValueError:
+                            body = {}
+                        daily_limit = quota.is_daily_limit_error(body)
+                        retry_after = e.response.headers.get("Retry-After", "")
+                        quota.record_429(daily_limit, float(retry_after) if retry_after.isdigit() else None)
+                        raise quota.QuotaExhausted(tool, "daily_limit_429" if daily_limit else "rate_limit_429") from e
+                    raise
+                quota.record_success()
+                return result
+
+    return await deadlines.within("cse", search(), cap=settings.cse_timeout_seconds)
+
+# Returned when a tool has no quota and nothing cached, so the agent answers without it.
+def _quota_unavailable(what: str) -> Dict[str, Any]:
+    return {
+        'status': 'unavailable',
+        'message': (
+            f"Live {what} search is unavailable for the rest of today. Answer from your own knowledge, "
+            "and tell the farmer the information may not be current."
+        ),
+    }
+
+def _stale(result: Dict[str, Any]) -> Dict[str, Any]:
+    metrics.incr("cse_quota.served_stale")
+    return {**result, 'content': result['content'] + "\n\n_(Saved from an earlier search; live search is temporarily unavailable.)_"}
+
+def _format_stored_price(crop: str, location: str, price: Dict[str, Any]) -> str:
+    details = [f"Modal: ₹{price['modal_price']:,.0f}/quintal"] if price.get('modal_price') is not None else []
+    if price.get('min_price') is not None:
+        details.append(f"Min: ₹{price['min_price']:,.0f}")
+    if price.get('max_price') is not None:
+        details.append(f"Max: ₹{price['max_price']:,.0f}")
+    return (
+        f"📊 **Market Prices for {crop} in {location}** (as of {price['price_date']}, "
+        f"{price['sources']} source(s))\n\n" + ", ".join(details)
+    )
+
+@coalesce_within_batch
 async def get_market_prices(crop: str, location: str) -> Dict[str, Any]:
-    """Gets current market prices for a specific crop in a given location using Google Custom Search."""
+    """Gets current market prices for a specific crop in a given location, from the price store or Google Custom Search."""
     try:
         logger.info(f"Fetching market prices for {crop} in {location}")
+        crop_key = market_prices.normalize_crop(crop)
+        market_key = market_prices.normalize_market(location)
+
+        stored = await asyncio.to_thread(db.get_latest_mandi_price, crop_key, market_key)
+        if stored and (date.today() - stored['price_date']).days <= settings.mandi_price_max_age_days:
+            metrics.incr("market_prices.store_hits")
+            return {'status': 'success', 'content': _format_stored_price(crop, location, stored)}
+
         api_key = settings.gemini_api_key
         search_engine_id = settings.market_prices_search_engine_id
-        query = f'"{crop}" mandi price in "{location}"'
-        url = "https://www.googleapis.com/customsearch/v1"
+        query = f'"{crop}" mandi price in "{gazetteer.display_name(market_key)}"'
         params = {'key': api_key, 'cx': search_engine_id, 'q': query, 'num': 3}
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params, timeout=15)
-            response.raise_for_status()
-            
-        search_results = response.json()
+
+        try:
+            search_results = await _cse_search(params, "market_prices")
+        except quota.QuotaExhausted:
+            if stored:
+                metrics.incr("cse_quota.served_stale")
+                return {'status': 'success', 'content': _format_stored_price(crop, location, stored) +
+                        "\n\n_(Latest recorded price; live search is temporarily unavailable.)_"}
+            return _quota_unavailable("market price")
         if "items" in search_results and search_results["items"]:
+            records = market_prices.parse_search_items(search_results["items"], crop, market_key)
+            if records:
+                try:
+                    await asyncio.to_thread(db.save_mandi_prices, [r.to_dict() for r in records])
+                except Exception as e:
+                    logger.warning(f"Could not store parsed market prices: {e}")
+            metrics.incr("market_prices.records_parsed", len(records))
+
             output = f"📊 **Market Prices for {crop} in {location}**\n\n"
             for item in search_results["items"]:
                 title = item.get('title', 'No Title')
@@ -49,21 +221,52 @@ async def get_market_prices(crop: str, location: str) -> Dict[str, Any]:
     except Exception as e:
         return {'status': 'error', 'message': f"Failed to fetch market prices: {str(e)}"}
 
+@coalesce_within_batch
+async def get_market_price_trend(crop: str, location: str, days: int = 30) -> Dict[str, Any]:
+    """Gets the recorded price trend (modal price per day) for a crop in a market over the last N days."""
+    try:
+        logger.info(f"Fetching {days}-day price trend for {crop} in {location}")
+        end_date = date.today()
+        rows = await asyncio.to_thread(
+            db.get_mandi_price_range,
+            market_prices.normalize_crop(crop), market_prices.normalize_market(location),
+            end_date - timedelta(days=days), end_date,
+        )
+        trend = market_prices.summarize_trend(rows)
+        if not trend["points"]:
+            return {'status': 'error', 'message': f"No recorded prices for '{crop}' in '{location}' in the last {days} days. Try get_market_prices for today's price."}
+
+        output = (
+            f"📈 **Price trend for {crop} in {location}** ({trend['from_date']} to {trend['to_date']}, {trend['points']} days recorded)\n\n"
+            f"Modal price moved from ₹{trend['start_modal_price']:,.0f} to ₹{trend['latest_modal_price']:,.0f}/quintal "
+            f"({trend['change_percent'] or 0:+}%). Range: ₹{trend['lowest']:,.0f} - ₹{trend['highest']:,.0f}.\n\n"
+        )
+        output += "\n".join(f"- {row['price_date']}: ₹{row['modal_price']:,.0f}" for row in rows if row['modal_price'] is not None)
+        return {'status': 'success', 'content': output}
+    except Exception as e:
+        return {'status': 'error', 'message': f"Failed to fetch the price trend: {str(e)}"}
+
+@coalesce_within_batch
 async def get_government_schemes(topic: str) -> Dict[str, Any]:
     """Finds relevant Indian government schemes for farmers based on a topic."""
     try:
         logger.info(f"Fetching government schemes for topic: {topic}")
+        cache_key = gazetteer.normalize_name(topic)
+        cached = _schemes_cache.get(cache_key)
+        if cached:
+            metrics.incr("tool_cache.schemes.hits")
+            return cached
+
         api_key = settings.gemini_api_key
         search_engine_id = settings.gov_schemes_search_engine_id
         query = f'government schemes and subsidies for "{topic}" for farmers in India'
-        url = "https://www.googleapis.com/customsearch/v1"
         params = {'key': api_key, 'cx': search_engine_id, 'q': query, 'num': 3}
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params, timeout=15)
-            response.raise_for_status()
-
-        search_results = response.json()
+        try:
+            search_results = await _cse_search(params, "schemes")
+        except quota.QuotaExhausted:
+            stale = _schemes_cache.get_stale(cache_key)
+            return _stale(stale) if stale else _quota_unavailable("government scheme")
         if "items" in search_results and search_results["items"]:
             output = f"🏛️ **Government Schemes for {topic}**\n\n"
             for item in search_results["items"]:
@@ -71,12 +274,15 @@ async def get_government_schemes(topic: str) -> Dict[str, Any]:
                 link = item.get('link', '')
                 snippet = item.get('snippet', 'No details available.').replace('\n', ' ').strip()
                 output += f"**Scheme:** {title}\n**Details:** {snippet}\n**Apply:** {link}\n---\n"
-            return {'status': 'success', 'content': output}
+            result = {'status': 'success', 'content': output}
+            _schemes_cache.set(cache_key, result)
+            return result
         else:
             return {'status': 'error', 'message': f"No government schemes found for '{topic}'."}
     except Exception as e:
         return {'status': 'error', 'message': f"Failed to fetch schemes: {str(e)}"}
 
+@coalesce_within_batch
 async def get_weather_advisory(location: str) -> Dict[str, Any]:
     """Gets a weather forecast for a specific location using a dedicated Google Custom Search."""
     try:
@@ -85,15 +291,22 @@ async def get_weather_advisory(location: str) -> Dict[str, Any]:
         search_engine_id = settings.weather_search_engine_id
         if not search_engine_id:
             return {'status': 'error', 'message': "Weather service is not configured."}
+
+        # Forecasts are fetched and cached per district, whatever spelling the user used.
+        cache_key = gazetteer.location_key(location)
+        cached = _weather_cache.get(cache_key)
+        if cached:
+            metrics.incr("tool_cache.weather.hits")
+            return cached
+        location = gazetteer.display_name(cache_key)
         query = f'weather forecast {location}'
-        url = "https://www.googleapis.com/customsearch/v1"
         params = {'key': api_key, 'cx': search_engine_id, 'q': query, 'num': 2}
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params, timeout=15)
-            response.raise_for_status()
-
-        search_results = response.json()
+        try:
+            search_results = await _cse_search(params, "weather")
+        except quota.QuotaExhausted:
+            stale = _weather_cache.get_stale(cache_key)
+            return _stale(stale) if stale else _quota_unavailable("weather")
         if "items" in search_results and search_results["items"]:
             output = f"🌤️ **Weather Forecast for {location} (from web search)**\n\n"
             for item in search_results["items"]:
@@ -102,7 +315,9 @@ async def get_weather_advisory(location: str) -> Dict[str, Any]:
                 link = item.get('link', '')
                 output += f"**Source:** {title}\n**Forecast Snippet:** {snippet}\n**More Info:** {link}\n---\n"
             output += "\n**Recommendation:** Please check the links for detailed forecasts."
-            return {'status': 'success', 'content': output}
+            result = {'status': 'success', 'content': output}
+            _weather_cache.set(cache_key, result)
+            return result
         else:
             return {'status': 'error', 'message': f"Could not find any reliable weather forecasts for '{location}'."}
     except Exception as e:
@@ -111,8 +326,12 @@ async def get_weather_advisory(location: str) -> Dict[str, Any]:
 
 # --- AGENT DEFINITION & CACHING ---
 
-@lru_cache(maxsize=2)
-def get_kisan_agent_definition() -> Agent:
+@lru_cache(maxsize=1)
+def _kisan_agent_config() -> Dict[str, Any]:
+    """Builds (once) the model, storage, tools and instruction template shared by every Kisan agent."""
+    from agno.models.google import Gemini
+    from agno.storage.postgres import PostgresStorage
+
     logger.info("--- Creating and Caching Kisan Mitra Agent Definition ---")
     
     gemini_model = Gemini(
@@ -122,7 +341,8 @@ def get_kisan_agent_definition() -> Agent:
     )
     
     storage = PostgresStorage(
-        table_name="agent_sessions",
+        table_name=settings.agent_storage_table,
+        schema=settings.agent_storage_schema,
         db_url=settings.postgres_url,
     )
     
@@ -138,6 +358,14 @@ def get_kisan_agent_definition() -> Agent:
         - Conversation Language: {user_language}
         </CONTEXT>
 
+        <EARLIER_CONVERSATION>
+        {history_summary}
+        </EARLIER_CONVERSATION>
+
+        <DAILY_ADVISORY>
+        {daily_advisory}
+        </DAILY_ADVISORY>
+
         ### CRITICAL INSTRUCTION: THE MULTILINGUAL MANDATE ###
         You MUST conduct this entire conversation in the specified "Conversation Language": **{user_language}**.
         - Your analysis, reasoning, and final response must be in **{user_language}**.
@@ -146,7 +374,7 @@ def get_kisan_agent_definition() -> Agent:
         <REASONING_FLOW>
         1.  **Analyze Query**: Fully understand the user's query in **{user_language}**.
         2.  **Assess Context**: Consider the user's location and the current date to provide timely, relevant advice.
-        3.  **Select Tools**: If the query is about market prices, weather, or government schemes, decide if a tool is necessary.
+        3.  **Select Tools**: If the query is about market prices or price trends, weather, or government schemes, first check the DAILY_ADVISORY for the user's district. Prefer it when it answers the question; call a tool only for details it does not cover.
         4.  **Synthesize Answer**:
             a. Gather information from your internal knowledge and any selected tools.
             ### CRITICAL TRANSLATION STEP ###
@@ -162,12 +390,16 @@ def get_kisan_agent_definition() -> Agent:
         </RESPONSE_PROTOCOL>
     """)
 
-    return Agent(
+    return dict(
         model=gemini_model,
         name="Kisan Mitra - Agricultural Expert",
         storage=storage,
-        tools=[get_market_prices, get_government_schemes, get_weather_advisory],
+        tools=[get_market_prices, get_market_price_trend, get_government_schemes, get_weather_advisory],
         instructions=agent_instructions,
+        # Only a short window of recent runs goes into the prompt; older turns are
+        # compacted into the rolling summary above (see backend/sessions.py).
+        add_history_to_messages=True,
+        num_history_runs=settings.agent_history_runs,
         markdown=True,
         add_datetime_to_instructions=True,
         debug_mode=False
@@ -175,34 +407,86 @@ def get_kisan_agent_definition() -> Agent:
 
 # --- ASYNC RESPONSE FUNCTIONS ---
 
+def _record_prompt_tokens(response: Any, metric_name: str) -> None:
+    """Reports the prompt tokens a run sent to Gemini, summed over its model calls."""
+    run_metrics = getattr(response, 'metrics', None) or {}
+    tokens = run_metrics.get('input_tokens') or run_metrics.get('prompt_tokens')
+    if isinstance(tokens, list):
+        tokens = sum(t for t in tokens if t)
+    if tokens:
+        metrics.observe(metric_name, tokens)
+
+async def ask_kisan_agent(prompt: str, user_info: Dict[str, Any]) -> str:
+    """Answers ``prompt`` with a per-request agent built on the cached definition. Raises on failure."""
+    from agno.agent import Agent
+
+    user_id = str(user_info['id']) if user_info.get('id') is not None else None
+    session_id = f"kisan_session_{user_id}" if user_id else None
+    logger.info(f"Processing query: '{prompt}' for session: {session_id or '(none)'}")
+
+    # A fresh Agent per request (sharing the cached model, storage and tools) keeps
+    # concurrent requests from overwriting each other's session and instructions.
+    config = _kisan_agent_config()
+    if session_id is None:
+        # Without a user id there is no session to keep: never store the run or replay
+        # someone else's history into the prompt.
+        config = {**config, "storage": None, "add_history_to_messages": False}
+    # Imported here: backend.advisories builds its digests with the tools in this module.
+    from backend import advisories
+    history_summary, daily_advisory = await asyncio.gather(
+        asyncio.to_thread(db.get_session_history_summary, session_id) if session_id else asyncio.sleep(0),
+        asyncio.to_thread(advisories.get_digest, user_info.get('location_id')),
+    )
+    if daily_advisory:
+        metrics.incr("advisories.injected")
+    formatted_instructions = config["instructions"].format(
+        user_name=user_info.get('name', 'Farmer'),
+        user_location=user_info.get('location', 'India'),
+        user_language=user_info.get('language', 'English'),
+        history_summary=history_summary or "(none)",
+        daily_advisory=daily_advisory or "(none)",
+    )
+    agent = Agent(**{**config, "instructions": formatted_instructions}, session_id=session_id, user_id=user_id)
+
+    response = await agent.arun(prompt)
+
+    _record_prompt_tokens(response, "agent.prompt_tokens")
+    return response.content if hasattr(response, 'content') else str(response)
+
 async def get_gemini_response(prompt: str, user_info: Dict[str, Any]) -> str:
-    """Gets a comprehensive agricultural response using the cached agent."""
+    """Gets a comprehensive agricultural response, or an apology if the agent fails."""
     try:
-        user_id = str(user_info.get('id', 'anonymous'))
-        session_id = f"kisan_session_{user_id}"
-        logger.info(f"Processing query: '{prompt}' for session: {session_id}")
-
-        agent = get_kisan_agent_definition()
-        agent.session_id = session_id
-        agent.user_id = user_id
-
-        formatted_instructions = agent.instructions.format(
-            user_name=user_info.get('name', 'Farmer'),
-            user_location=user_info.get('location', 'India'),
-            user_language=user_info.get('language', 'English') 
-        )
-        original_instructions = agent.instructions
-        agent.instructions = formatted_instructions
-        
-        response = await agent.arun(prompt)
-        
-        agent.instructions = original_instructions
-        
-        return response.content if hasattr(response, 'content') else str(response)
+        return await ask_kisan_agent(prompt, user_info)
     except Exception as e:
         logger.error(f"Error getting agricultural response: {e}", exc_info=True)
         return "I'm experiencing technical difficulties while processing your request. Please try again."
 
+async def summarize_advisory(district_name: str, material: str) -> Optional[str]:
+    """Condenses the day's weather, price and scheme results for a district into a short English digest."""
+    try:
+        from agno.agent import Agent
+
+        summary_agent = Agent(
+            model=_kisan_agent_config()["model"],
+            name="Kisan Mitra - Daily Advisory Writer",
+            instructions=dedent(f"""
+                Write today's farm advisory for {district_name} in English, in at most 150 words.
+                Use only the material provided. Cover the weather outlook and what it means for field work,
+                the latest mandi prices, and any scheme deadlines. Use short bullet points.
+            """),
+            debug_mode=False
+        )
+        async with admission.limiter("agent").slot():
+            response = await summary_agent.arun(material)
+        _record_prompt_tokens(response, "agent.advisory_prompt_tokens")
+        content = response.content if hasattr(response, 'content') else str(response)
+        return content.strip() or None
+    except admission.OverloadedError:
+        raise
+    except Exception as e:
+        logger.error(f"Error summarizing advisory for {district_name}: {e}", exc_info=True)
+        return None
+
 async def analyze_visuals(prompt: str, media_content: bytes, mime_type: str, user_info: Dict[str, Any]) -> str:
     try:
         logger.info(f"Processing image analysis for user {user_info.get('id')}")
@@ -230,8 +514,11 @@ async def analyze_visuals(prompt: str, media_content: bytes, mime_type: str, use
             </RESPONSE_PROTOCOL>
         """)
 
+        from agno.agent import Agent
+        from agno.media import Image
+
         visual_agent = Agent(
-            model=get_kisan_agent_definition().model,
+            model=_kisan_agent_config()["model"],
             name="Agricultural Diagnostic Specialist",
             instructions=visual_instructions,
             debug_mode=False
@@ -239,6 +526,7 @@ async def analyze_visuals(prompt: str, media_content: bytes, mime_type: str, use
         
         image = Image(content=media_content, mime_type=mime_type)
         response = await visual_agent.arun(prompt, images=[image])
+        _record_prompt_tokens(response, "agent.visual_prompt_tokens")
         
         return response.content if hasattr(response, 'content') else str(response)
     except Exception as e:
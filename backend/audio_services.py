@@ -1,22 +1,42 @@
-from google.cloud import speech, texttospeech
-from pydub import AudioSegment
 import io
 import wave
 import traceback
+from functools import lru_cache
+
+from backend import uploads
+
+# The Google Cloud SDKs and pydub are imported on first use so that importing this
+# module (and therefore booting an API worker) stays cheap.
+
+@lru_cache(maxsize=1)
+def _speech_client():
+    from google.cloud import speech
+    return speech.SpeechClient()
+
+@lru_cache(maxsize=1)
+def _tts_client():
+    from google.cloud import texttospeech
+    return texttospeech.TextToSpeechClient()
 
 print("✅ Running audio_services.py with EXPLICIT sample rate.")
 
-def transcribe_audio(content: bytes, language_code: str) -> str:
-    
+def transcribe_audio(content: uploads.Media, language_code: str, timeout: float = None) -> str:
+    """Transcribes audio given as bytes or a file handle (e.g. a spooled upload)."""
     try:
-        print(f"Transcribing audio: {len(content)} bytes, language: {language_code}")
+        from google.cloud import speech
+        from pydub import AudioSegment
 
-        if not content or len(content) < 100:
+        size = uploads.media_size(content)
+        print(f"Transcribing audio: {size} bytes, language: {language_code}")
+
+        if size < 100:
             print("Audio content is too small or empty")
             return ""
 
+        source = content if hasattr(content, "read") else io.BytesIO(content)
+        source.seek(0)
         try:
-            sound = AudioSegment.from_file(io.BytesIO(content))
+            sound = AudioSegment.from_file(source)
         except Exception as e:
             print(f"Failed to load audio with pydub: {e}")
             return ""
@@ -63,7 +83,7 @@ def transcribe_audio(content: bytes, language_code: str) -> str:
             print(f"WAV validation failed: {e}")
             return ""
 
-        client = speech.SpeechClient()
+        client = _speech_client()
         audio = speech.RecognitionAudio(content=mono_content)
 
        
@@ -79,7 +99,7 @@ def transcribe_audio(content: bytes, language_code: str) -> str:
         )
 
         print(f"Sending request to Google Speech-to-Text API with sample rate {final_sample_rate}...")
-        response = client.recognize(config=config, audio=audio)
+        response = client.recognize(config=config, audio=audio, timeout=timeout)
 
         if response and response.results:
             transcript = response.results[0].alternatives[0].transcript.strip()
@@ -95,23 +115,31 @@ def transcribe_audio(content: bytes, language_code: str) -> str:
         traceback.print_exc()
         return ""
 
-def synthesize_speech(text: str, language_code: str) -> bytes:
-    """Converts text to speech using Google Cloud Text-to-Speech."""
+def synthesize_speech(text: str, language_code: str, timeout: float = None,
+                      audio_encoding: str = "MP3", sample_rate_hertz: int = None) -> bytes:
+    """Converts text to speech using Google Cloud Text-to-Speech.
+
+    ``audio_encoding`` names a ``texttospeech.AudioEncoding`` member (e.g. "MP3" or
+    "OGG_OPUS"); ``sample_rate_hertz`` of None keeps the voice's natural rate.
+    """
     try:
-        print(f"Synthesizing speech: '{text[:50]}...' in {language_code}")
+        from google.cloud import texttospeech
+
+        print(f"Synthesizing speech: '{text[:50]}...' in {language_code} as {audio_encoding}")
 
         if not text.strip():
             print("No text to synthesize")
             return b""
 
-        client = texttospeech.TextToSpeechClient()
+        client = _tts_client()
         synthesis_input = texttospeech.SynthesisInput(text=text)
         voice = texttospeech.VoiceSelectionParams(
             language_code=language_code,
             ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL
         )
         audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3,
+            audio_encoding=texttospeech.AudioEncoding[audio_encoding],
+            sample_rate_hertz=sample_rate_hertz or 0,
             speaking_rate=1.0,
             pitch=0.0
         )
@@ -119,7 +147,8 @@ def synthesize_speech(text: str, language_code: str) -> bytes:
         response = client.synthesize_speech(
             input=synthesis_input,
             voice=voice,
-            audio_config=audio_config
+            audio_config=audio_config,
+            timeout=timeout,
         )
 
         print(f"Speech synthesis successful: {len(response.audio_content)} bytes")
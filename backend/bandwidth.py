@@ -0,0 +1,149 @@
+# backend/bandwidth.py
+
+"""Response profiles for clients on slow (2G/3G) connections.
+
+Clients pick a ``bandwidth_profile``. The "low" profile synthesizes speech as
+OGG_OPUS at ``settings.low_bandwidth_tts_sample_rate`` instead of
+full-rate MP3. Independently of the profile, a client can ask for the
+audio to be *deferred*. The answer then carries an ``audio_url`` in place
+of the inline base64 audio. Speech is only synthesized if the client
+fetches that URL within ``settings.deferred_audio_ttl_seconds``. The
+request and the synthesized audio are kept in Postgres, so any worker can
+serve the URL. A small in-process cache, capped at
+``settings.deferred_audio_cache_bytes``, serves repeated downloads.
+
+``compact_json_response`` compresses JSON with brotli (when installed) or
+gzip, whichever the client accepts. It records the bytes saved in
+``/metrics``.
+"""
+
+import asyncio
+import gzip
+import json
+import secrets
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from backend import admission, audio_services, deadlines, metrics, database as db
+from backend.cache import TTLCache
+from backend.config import settings
+
+
+@dataclass(frozen=True)
+class Profile:
+    name: str
+    audio_encoding: str
+    audio_mime_type: str
+    sample_rate_hertz: Optional[int] = None
+
+
+def get_profile(name: Optional[str]) -> Profile:
+    """Returns the named profile; unknown or missing names get "standard"."""
+    if (name or "").strip().lower() == "low":
+        return Profile("low", "OGG_OPUS", "audio/ogg", settings.low_bandwidth_tts_sample_rate)
+    return Profile("standard", "MP3", "audio/mpeg")
+
+
+# --- Speech ---
+
+async def synthesize(text: str, language_code: str, profile: Profile) -> bytes:
+    """Synthesizes ``text`` in the profile's encoding under the TTS limiter and stage budget."""
+    audio = await deadlines.within("tts", admission.run_blocking(
+        "tts", audio_services.synthesize_speech, text, language_code,
+        timeout=deadlines.stage_budget("tts"),
+        audio_encoding=profile.audio_encoding,
+        sample_rate_hertz=profile.sample_rate_hertz,
+    ))
+    if audio:
+        metrics.observe(f"tts.audio_bytes.{profile.name}", len(audio))
+    return audio
+
+
+# token -> (audio, mime type), bounded by total audio bytes.
+_audio_cache = TTLCache(
+    ttl_seconds=settings.deferred_audio_ttl_seconds, max_entries=4096,
+    max_bytes=settings.deferred_audio_cache_bytes, sizeof=lambda entry: len(entry[0]),
+)
+
+
+async def defer_audio(text: str, language_code: str, profile: Profile) -> Optional[str]:
+    """Stores a speech request for later and returns the URL that synthesizes it (None if it can't be stored)."""
+    token = secrets.token_urlsafe(16)
+    if not await asyncio.to_thread(db.create_deferred_audio, token, text, language_code, profile.name):
+        return None
+    metrics.incr("tts.deferred")
+    return f"/audio/{token}"
+
+
+async def fetch_deferred_audio(token: str) -> Optional[Tuple[bytes, str]]:
+    """Returns ``(audio, mime_type)`` for a deferred request, or None if unknown or expired."""
+    cached = _audio_cache.get(token)
+    if cached is not None:
+        return cached
+    entry = await asyncio.to_thread(db.get_deferred_audio, token, settings.deferred_audio_ttl_seconds)
+    if entry is None:
+        return None
+    profile = get_profile(entry["profile"])
+    audio = entry["audio"]
+    if audio is None:
+        audio = await synthesize(entry["text"], entry["language_code"], profile)
+        if not audio:
+            return None
+        metrics.incr("tts.deferred_fetched")
+        # Keep the audio so a retried download over a flaky link doesn't synthesize again.
+        await asyncio.to_thread(db.save_deferred_audio, token, audio)
+    _audio_cache.set(token, (audio, profile.audio_mime_type))
+    return audio, profile.audio_mime_type
+
+
+# --- Compressed JSON ---
+
+@lru_cache(maxsize=1)
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def _accepted_encodings(request: Request) -> set:
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.partition(";")
+        params = params.replace(" ", "")
+        try:
+            quality = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            quality = 0.0
+        if coding.strip() and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def compact_json_response(request: Request, content: Dict[str, Any], status_code: int = 200,
+                          headers: Dict[str, str] = None) -> Response:
+    """A JSON response compressed for the client's Accept-Encoding, with bytes saved reported in metrics."""
+    body = json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept-Encoding"
+    raw_size = len(body)
+
+    if raw_size >= settings.response_compression_min_bytes:
+        accepted = _accepted_encodings(request)
+        brotli = _brotli()
+        if brotli is not None and "br" in accepted:
+            body = brotli.compress(body, quality=5)
+            headers["Content-Encoding"] = "br"
+        elif "gzip" in accepted:
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+
+    metrics.observe("responses.json_bytes_raw", raw_size)
+    metrics.observe("responses.json_bytes_sent", len(body))
+    metrics.incr("responses.bytes_saved", raw_size - len(body))
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
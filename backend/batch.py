@@ -0,0 +1,105 @@
+# backend/batch.py
+
+"""Batch processing of text queries forwarded by SMS/IVR gateways.
+
+Queries run concurrently under ``settings.batch_max_concurrency``, each with
+its own deadline. Identical tool calls across the batch are made once (see
+``ai_services.tool_call_memo``). Translations are grouped by target language
+and sent as list requests rather than one request per answer. Results come
+back in input order, each item with its own error, so one bad item never
+fails the batch.
+"""
+
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from backend import admission, ai_services, deadlines, gazetteer, metrics, translation_services
+from backend.config import settings
+from backend.utils import get_language_codes
+
+FALLBACK_ERROR = "Could not process this query."
+
+
+async def _answer_in_english(item: Dict[str, Any], semaphore: asyncio.Semaphore) -> str:
+    async with semaphore:
+        with deadlines.scope():
+            place = gazetteer.resolve_specific(item["user_location"])
+            user_info = {
+                "location": gazetteer.display_name(place.id) if place else item["user_location"],
+                "location_id": place.id if place else None,
+            }
+            if item.get("user_id"):
+                user_info["id"] = item["user_id"]
+            async with admission.limiter("agent").slot():
+                return await deadlines.within(
+                    "agent", ai_services.ask_kisan_agent(item["text_query"].strip(), user_info)
+                )
+
+
+async def _translate_group(texts: List[str], target_language: str) -> List[str]:
+    with deadlines.scope():
+        return await deadlines.within("translate", admission.run_blocking(
+            "translate", translation_services.translate_texts, texts, target_language
+        ))
+
+
+async def run_batch(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Answers a list of text queries; returns one ``{index, ai_response, error}`` per item, in order."""
+    results = [{"index": i, "ai_response": None, "error": None} for i in range(len(items))]
+    semaphore = asyncio.Semaphore(settings.batch_max_concurrency)
+
+    pending = []
+    for i, item in enumerate(items):
+        if not (item.get("text_query") or "").strip():
+            results[i]["error"] = "Empty query."
+        else:
+            pending.append(i)
+
+    # 1. Agent answers (in English), with identical tool calls shared across the batch.
+    with ai_services.tool_call_memo():
+        answers = await asyncio.gather(
+            *(_answer_in_english(items[i], semaphore) for i in pending), return_exceptions=True
+        )
+
+    english = {}
+    for i, answer in zip(pending, answers):
+        if isinstance(answer, admission.OverloadedError):
+            results[i]["error"] = "The service is busy right now. Please try again shortly."
+        elif isinstance(answer, deadlines.DeadlineExceeded):
+            results[i]["error"] = "Timed out while preparing an answer."
+        elif isinstance(answer, Exception):
+            print(f"Batch item {i} failed: {answer}")
+            results[i]["error"] = FALLBACK_ERROR
+        else:
+            english[i] = answer
+
+    # 2. One translation request per target language instead of one per answer.
+    by_language = defaultdict(list)
+    for i, answer in english.items():
+        target = get_language_codes(items[i].get("language_name", "English"))["translate"]
+        if target == "en" or not answer:
+            results[i]["ai_response"] = answer
+        else:
+            by_language[target].append(i)
+
+    languages = list(by_language)
+    translations = await asyncio.gather(
+        *(_translate_group([english[i] for i in by_language[lang]], lang) for lang in languages),
+        return_exceptions=True,
+    )
+    for lang, translated in zip(languages, translations):
+        indices = by_language[lang]
+        if isinstance(translated, Exception):
+            # An English answer beats no answer.
+            print(f"Batch translation to '{lang}' failed: {translated}")
+            for i in indices:
+                results[i]["ai_response"] = english[i]
+                results[i]["error"] = "Translation failed; answer is in English."
+        else:
+            for i, text in zip(indices, translated):
+                results[i]["ai_response"] = text
+
+    metrics.incr("batch.items", len(items))
+    metrics.incr("batch.translation_requests", len(languages))
+    return results
@@ -1,3 +1,4 @@
+import os
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 load_dotenv()
@@ -9,6 +10,88 @@ class Settings(BaseSettings):
     market_prices_search_engine_id:str
     gov_schemes_search_engine_id: str
     weather_search_engine_id: str
+    run_migrations_on_startup: bool = True
+    # API worker processes sharing this deployment (uvicorn --workers); process-local
+    # shares of deployment-wide limits are divided by it.
+    api_workers: int = int(os.environ.get("WEB_CONCURRENCY", "1"))
+
+    # --- Admission control ---
+    interaction_max_concurrency: int = 16
+    interaction_max_queue: int = 64
+    interaction_max_wait_seconds: float = 20.0
+    agent_max_concurrency: int = 8
+    cse_max_concurrency: int = 8
+    stt_max_concurrency: int = 4
+    tts_max_concurrency: int = 4
+    translate_max_concurrency: int = 8
+    upstream_max_queue: int = 32
+    upstream_max_wait_seconds: float = 10.0
+    overload_retry_after_seconds: int = 5
+
+    # --- Deadlines & hedging ---
+    interaction_deadline_seconds: float = 60.0
+    cse_timeout_seconds: float = 15.0
+    cse_hedging_enabled: bool = False
+    cse_hedge_default_delay_seconds: float = 2.0
+    cse_hedge_min_delay_seconds: float = 0.5
+
+    # --- Asynchronous jobs ---
+    job_workers: int = 4
+    job_max_pending: int = 500
+    job_max_attempts: int = 3
+    job_deadline_seconds: float = 120.0
+    job_poll_interval_seconds: float = 2.0
+    job_max_long_poll_seconds: float = 30.0
+    job_sweep_interval_seconds: float = 60.0  # how often jobs out of attempts are marked failed
+    job_retention_hours: int = 24
+
+    # --- Agent session history ---
+    # agno's PostgresStorage table; not the legacy public.agent_sessions created by initialize_db.
+    agent_storage_schema: str = "ai"
+    agent_storage_table: str = "agent_sessions"
+    agent_history_runs: int = 3
+    agent_history_token_budget: int = 4000
+    session_compaction_interval_seconds: int = 3600
+    session_compaction_idle_minutes: int = 30
+
+    # --- Mandi price store ---
+    mandi_price_max_age_days: int = 1
+
+    # --- Custom Search quota ---
+    cse_daily_query_budget: int = 10000
+    cse_quota_burst: int = 30
+    cse_quota_pacing_factor: float = 3.0  # allowed peak rate, as a multiple of the even spend rate
+    cse_rate_limit_backoff_seconds: float = 10.0  # after a per-minute 429; doubles while they continue
+
+    # --- Tool result caches ---
+    weather_cache_ttl_seconds: int = 3 * 3600
+    schemes_cache_ttl_seconds: int = 24 * 3600
+
+    # --- Uploads ---
+    max_audio_upload_bytes: int = 10 * 1024 * 1024
+    max_image_upload_bytes: int = 8 * 1024 * 1024
+    upload_spool_threshold_bytes: int = 512 * 1024  # larger file parts are spooled to disk
+
+    # --- Low-bandwidth responses ---
+    low_bandwidth_tts_sample_rate: int = 16000
+    response_compression_min_bytes: int = 512
+    deferred_audio_ttl_seconds: int = 600
+    deferred_audio_cache_bytes: int = 16 * 1024 * 1024  # per process
+
+    # --- Daily district advisories ---
+    advisories_enabled: bool = True
+    advisory_run_hour: int = 5  # IST, before the morning peak
+    advisory_languages: str = "English,Hindi,Kannada,Tamil,Telugu,Malayalam,Bengali,Marathi"
+    advisory_crops: str = "onion,tomato,potato"
+    advisory_schemes_topic: str = "crop insurance and input subsidies"
+    advisory_concurrency: int = 2
+    advisory_max_age_hours: int = 30
+    advisory_claim_stale_minutes: int = 60  # longer than a run takes; an older unfinished claim is retaken
+    advisory_retry_minutes: int = 10
+
+    # --- Batch queries ---
+    batch_max_items: int = 200
+    batch_max_concurrency: int = 8
 
     class Config:
         env_file = ".env"
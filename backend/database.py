@@ -1,6 +1,9 @@
 import psycopg2
 import psycopg2.extras
+import psycopg2.errors
+from psycopg2 import sql
 import json
+from datetime import date
 from backend.config import settings
 
 def get_db_connection():
@@ -28,6 +31,7 @@ def initialize_db():
                 city VARCHAR(255) NOT NULL,
                 password TEXT NOT NULL
             );
+            ALTER TABLE users ADD COLUMN IF NOT EXISTS location_id VARCHAR(64);
         """)
         
         print("Creating 'agent_sessions' table...")
@@ -59,19 +63,102 @@ def initialize_db():
                 created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
     );
         """)
+
+        print("Creating 'interaction_jobs' table...")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS interaction_jobs (
+                id VARCHAR(36) PRIMARY KEY,
+                idempotency_key VARCHAR(255) UNIQUE,
+                status VARCHAR(20) NOT NULL DEFAULT 'queued',
+                request JSONB NOT NULL,
+                audio_content BYTEA,
+                visual_content BYTEA,
+                visual_mime_type VARCHAR(100),
+                result JSONB,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_expires_at TIMESTAMP WITH TIME ZONE,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE INDEX IF NOT EXISTS interaction_jobs_pending_idx
+                ON interaction_jobs (created_at) WHERE status IN ('queued', 'running');
+        """)
+
+        # Partitioned by month on price_date. The primary key doubles as the
+        # (crop, market, price_date) lookup index on every partition.
+        print("Creating 'mandi_prices' table...")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS mandi_prices (
+                crop VARCHAR(100) NOT NULL,
+                market VARCHAR(255) NOT NULL,
+                price_date DATE NOT NULL,
+                min_price NUMERIC(10, 2),
+                max_price NUMERIC(10, 2),
+                modal_price NUMERIC(10, 2),
+                source_url TEXT NOT NULL DEFAULT '',
+                fetched_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (crop, market, price_date, source_url)
+            ) PARTITION BY RANGE (price_date);
+        """)
+
+        print("Creating 'district_advisories' table...")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS district_advisories (
+                district_id VARCHAR(64) NOT NULL,
+                language VARCHAR(64) NOT NULL,
+                digest TEXT NOT NULL,
+                generated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (district_id, language)
+            );
+            CREATE TABLE IF NOT EXISTS advisory_runs (
+                run_date DATE PRIMARY KEY,
+                claimed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP WITH TIME ZONE
+            );
+            ALTER TABLE advisory_runs ADD COLUMN IF NOT EXISTS finished_at TIMESTAMP WITH TIME ZONE;
+        """)
+
+        print("Creating 'deferred_audio' table...")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS deferred_audio (
+                token VARCHAR(64) PRIMARY KEY,
+                text TEXT NOT NULL,
+                language_code VARCHAR(16) NOT NULL,
+                profile VARCHAR(16) NOT NULL,
+                audio BYTEA,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+
+        print("Creating 'cse_quota_usage' table...")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS cse_quota_usage (
+                usage_date DATE NOT NULL,
+                tool VARCHAR(64) NOT NULL,
+                queries INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (usage_date, tool)
+            );
+        """)
+
+        today = date.today()
+        for offset in range(-12, 2):
+            year, month = divmod(today.year * 12 + today.month - 1 + offset, 12)
+            _create_price_partition(cur, year, month + 1)
     conn.commit()
     conn.close()
+    backfill_user_location_ids()
     print("Database initialization check complete.")
 
-def register_user(name, state, district, city, password):
+def register_user(name, state, district, city, password, location_id=None):
     """Registers a new user. Returns True on success, False if user exists."""
     conn = get_db_connection()
     if conn is None: return False
     try:
         with conn.cursor() as cur:
             cur.execute(
-                "INSERT INTO users (name, state, district, city, password) VALUES (%s, %s, %s, %s, %s)",
-                (name, state, district, city, password)
+                "INSERT INTO users (name, state, district, city, password, location_id) VALUES (%s, %s, %s, %s, %s, %s)",
+                (name, state, district, city, password, location_id)
             )
         conn.commit()
         return True
@@ -93,6 +180,25 @@ def login_user(name, password):
     conn.close()
     return user
 
+def backfill_user_location_ids():
+    """Resolves canonical location IDs for users registered before the gazetteer existed."""
+    from backend import gazetteer
+
+    conn = get_db_connection()
+    if conn is None: return
+    with conn.cursor() as cur:
+        cur.execute("SELECT id, city, district, state FROM users WHERE location_id IS NULL")
+        updates = []
+        for user_id, city, district, state in cur.fetchall():
+            place = gazetteer.resolve_specific(f"{city}, {district}, {state}")
+            if place:
+                updates.append((place.id, user_id))
+        if updates:
+            cur.executemany("UPDATE users SET location_id = %s WHERE id = %s", updates)
+            print(f"Backfilled location IDs for {len(updates)} users.")
+    conn.commit()
+    conn.close()
+
 # --- Agent Memory and History Functions ---
 
 def get_session(session_id):
@@ -147,4 +253,498 @@ def get_chat_history(session_id, limit=4):
         records = cur.fetchall()
         messages = [dict(row) for row in reversed(records)]
     conn.close()
-    return messages
\ No newline at end of file
+    return messages
+
+# --- Interaction Job Queue Functions ---
+
+def create_job(job_id, request, audio_content=None, visual_content=None, visual_mime_type=None, idempotency_key=None):
+    """Queues a job. Returns the id of the new job, or of the existing job with the same idempotency key."""
+    conn = get_db_connection()
+    if conn is None: return None
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO interaction_jobs (id, idempotency_key, request, audio_content, visual_content, visual_mime_type)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT (idempotency_key) DO NOTHING
+                RETURNING id;
+            """, (
+                job_id, idempotency_key, json.dumps(request),
+                psycopg2.Binary(audio_content) if audio_content else None,
+                psycopg2.Binary(visual_content) if visual_content else None,
+                visual_mime_type,
+            ))
+            row = cur.fetchone()
+            if row is None:
+                cur.execute("SELECT id FROM interaction_jobs WHERE idempotency_key = %s", (idempotency_key,))
+                row = cur.fetchone()
+        conn.commit()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+def count_pending_jobs():
+    conn = get_db_connection()
+    if conn is None: return 0
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM interaction_jobs WHERE status IN ('queued', 'running')")
+        count = cur.fetchone()[0]
+    conn.close()
+    return count
+
+def claim_next_job(lease_seconds, max_attempts):
+    """Atomically claims the oldest queued job, or a running job whose worker's lease expired."""
+    conn = get_db_connection()
+    if conn is None: return None
+    job = None
+    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+        cur.execute("""
+            UPDATE interaction_jobs SET
+                status = 'running',
+                attempts = attempts + 1,
+                lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => %s),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM interaction_jobs
+                WHERE (status = 'queued' OR (status = 'running' AND lease_expires_at < CURRENT_TIMESTAMP))
+                  AND attempts < %s
+                ORDER BY created_at
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id, request, audio_content, visual_content, visual_mime_type, attempts;
+        """, (lease_seconds, max_attempts))
+        record = cur.fetchone()
+        if record:
+            job = dict(record)
+            for key in ("audio_content", "visual_content"):
+                if job[key] is not None:
+                    job[key] = bytes(job[key])
+    conn.commit()
+    conn.close()
+    return job
+
+def finish_job(job_id, status, result=None, error=None):
+    """Records a job's outcome and drops its uploaded media, which is no longer needed."""
+    conn = get_db_connection()
+    if conn is None: return
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE interaction_jobs SET
+                status = %s, result = %s, error = %s,
+                audio_content = NULL, visual_content = NULL,
+                lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s;
+        """, (status, json.dumps(result) if result is not None else None, error, job_id))
+    conn.commit()
+    conn.close()
+
+def requeue_job(job_id):
+    """Hands a claimed job back to the queue without counting the claim as an attempt."""
+    conn = get_db_connection()
+    if conn is None: return
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE interaction_jobs SET
+                status = 'queued', attempts = GREATEST(attempts - 1, 0),
+                lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s;
+        """, (job_id,))
+    conn.commit()
+    conn.close()
+
+def fail_exhausted_jobs(max_attempts):
+    """Marks jobs that crashed their worker too many times as failed."""
+    conn = get_db_connection()
+    if conn is None: return
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE interaction_jobs SET
+                status = 'failed', error = 'Job could not be completed.',
+                audio_content = NULL, visual_content = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE status IN ('queued', 'running') AND attempts >= %s
+              AND (lease_expires_at IS NULL OR lease_expires_at < CURRENT_TIMESTAMP);
+        """, (max_attempts,))
+    conn.commit()
+    conn.close()
+
+def get_job(job_id):
+    conn = get_db_connection()
+    if conn is None: return None
+    job = None
+    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+        cur.execute(
+            "SELECT id, status, result, error, attempts, created_at, updated_at FROM interaction_jobs WHERE id = %s",
+            (job_id,)
+        )
+        record = cur.fetchone()
+        if record:
+            job = dict(record)
+    conn.close()
+    return job
+
+def delete_finished_jobs(older_than_hours):
+    conn = get_db_connection()
+    if conn is None: return
+    with conn.cursor() as cur:
+        cur.execute("""
+            DELETE FROM interaction_jobs
+            WHERE status IN ('succeeded', 'failed')
+              AND updated_at < CURRENT_TIMESTAMP - make_interval(hours => %s);
+        """, (older_than_hours,))
+    conn.commit()
+    conn.close()
+
+# --- Agent Session Compaction Functions ---
+# These operate on the table agno's PostgresStorage creates and owns
+# (settings.agent_storage_schema/agent_storage_table: memory/session_data JSONB,
+# updated_at as epoch seconds), not on the legacy public.agent_sessions above.
+
+def _agent_storage_table():
+    return sql.SQL("{}.{}").format(
+        sql.Identifier(settings.agent_storage_schema), sql.Identifier(settings.agent_storage_table)
+    )
+
+def get_sessions_to_compact(min_bytes, idle_before, limit=200):
+    conn = get_db_connection()
+    if conn is None: return []
+    sessions = []
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+            cur.execute(sql.SQL("""
+                SELECT session_id, memory, session_data->>'history_summary' AS history_summary
+                FROM {}
+                WHERE updated_at < %s AND octet_length(memory::text) > %s
+                ORDER BY updated_at
+                LIMIT %s
+            """).format(_agent_storage_table()), (idle_before, min_bytes, limit))
+            sessions = [dict(row) for row in cur.fetchall()]
+    except psycopg2.errors.UndefinedTable:
+        pass  # agno creates its table on the first stored run
+    finally:
+        conn.close()
+    return sessions
+
+def update_session_memory(session_id, memory, history_summary, idle_before):
+    """Writes back a compacted session, unless the agent touched it in the meantime."""
+    conn = get_db_connection()
+    if conn is None: return False
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("""
+            UPDATE {} SET
+                memory = %s,
+                session_data = jsonb_set(COALESCE(session_data, '{{}}'::jsonb), '{{history_summary}}', to_jsonb(%s::text))
+            WHERE session_id = %s AND updated_at < %s;
+        """).format(_agent_storage_table()), (json.dumps(memory), history_summary, session_id, idle_before))
+        updated = cur.rowcount > 0
+    conn.commit()
+    conn.close()
+    return updated
+
+def get_session_history_summary(session_id):
+    conn = get_db_connection()
+    if conn is None: return ""
+    summary = ""
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("SELECT session_data->>'history_summary' FROM {} WHERE session_id = %s").format(_agent_storage_table()),
+                (session_id,)
+            )
+            record = cur.fetchone()
+            if record and record[0]:
+                summary = record[0]
+    except psycopg2.errors.UndefinedTable:
+        pass  # no agno session stored yet
+    except psycopg2.Error as e:
+        print(f"Could not read session summary: {e}")
+    finally:
+        conn.close()
+    return summary
+
+# --- Mandi Price Store Functions ---
+
+_price_partitions = set()
+
+def _create_price_partition(cur, year, month):
+    if (year, month) in _price_partitions:
+        return
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS mandi_prices_{year}_{month:02d} PARTITION OF mandi_prices
+        FOR VALUES FROM ('{year}-{month:02d}-01') TO ('{next_year}-{next_month:02d}-01');
+    """)
+    _price_partitions.add((year, month))
+
+def save_mandi_prices(records):
+    """Upserts parsed price records (dicts with crop, market, price_date, min/max/modal_price, source_url)."""
+    if not records: return
+    conn = get_db_connection()
+    if conn is None: return
+    try:
+        with conn.cursor() as cur:
+            for record in records:
+                price_date = date.fromisoformat(str(record["price_date"]))
+                _create_price_partition(cur, price_date.year, price_date.month)
+            psycopg2.extras.execute_values(cur, """
+                INSERT INTO mandi_prices (crop, market, price_date, min_price, max_price, modal_price, source_url)
+                VALUES %s
+                ON CONFLICT (crop, market, price_date, source_url) DO UPDATE SET
+                    min_price = EXCLUDED.min_price,
+                    max_price = EXCLUDED.max_price,
+                    modal_price = EXCLUDED.modal_price,
+                    fetched_at = CURRENT_TIMESTAMP;
+            """, [
+                (r["crop"], r["market"], r["price_date"], r["min_price"], r["max_price"], r["modal_price"], r["source_url"])
+                for r in records
+            ])
+        conn.commit()
+    except Exception:
+        # The transaction may have rolled back partition DDL; re-check next time.
+        _price_partitions.clear()
+        raise
+    finally:
+        conn.close()
+
+_DAILY_PRICE_COLUMNS = """
+    price_date,
+    MIN(min_price)::float AS min_price,
+    MAX(max_price)::float AS max_price,
+    ROUND(AVG(modal_price), 2)::float AS modal_price,
+    COUNT(*) AS sources
+"""
+
+def get_latest_mandi_price(crop, market):
+    """Returns the most recent day's prices for a crop in a market, combined across sources."""
+    conn = get_db_connection()
+    if conn is None: return None
+    price = None
+    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+        cur.execute(f"""
+            SELECT {_DAILY_PRICE_COLUMNS} FROM mandi_prices
+            WHERE crop = %s AND market = %s
+              AND price_date = (SELECT MAX(price_date) FROM mandi_prices WHERE crop = %s AND market = %s)
+            GROUP BY price_date
+        """, (crop, market, crop, market))
+        record = cur.fetchone()
+        if record:
+            price = dict(record)
+    conn.close()
+    return price
+
+def get_mandi_price_range(crop, market, start_date, end_date):
+    """Returns one row per day (oldest first) between the two dates, inclusive."""
+    conn = get_db_connection()
+    if conn is None: return []
+    rows = []
+    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+        cur.execute(f"""
+            SELECT {_DAILY_PRICE_COLUMNS} FROM mandi_prices
+            WHERE crop = %s AND market = %s AND price_date BETWEEN %s AND %s
+            GROUP BY price_date
+            ORDER BY price_date
+        """, (crop, market, start_date, end_date))
+        rows = [dict(row) for row in cur.fetchall()]
+    conn.close()
+    return rows
+
+# --- District Advisory Functions ---
+
+def get_active_district_ids():
+    """District IDs (e.g. 'in-ka/kolar') of all users with a resolved location."""
+    conn = get_db_connection()
+    if conn is None: return []
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT DISTINCT split_part(location_id, '/', 1) || '/' || split_part(location_id, '/', 2)
+            FROM users
+            WHERE location_id LIKE '%%/%%'
+        """)
+        district_ids = [row[0] for row in cur.fetchall()]
+    conn.close()
+    return district_ids
+
+def claim_advisory_run(run_date, stale_after_minutes):
+    """Returns True for one caller at a time per run date.
+
+    An unfinished claim older than ``stale_after_minutes`` can be taken over.
+    """
+    conn = get_db_connection()
+    if conn is None: return False
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO advisory_runs (run_date) VALUES (%s)
+            ON CONFLICT (run_date) DO UPDATE SET claimed_at = CURRENT_TIMESTAMP
+            WHERE advisory_runs.finished_at IS NULL
+              AND advisory_runs.claimed_at < CURRENT_TIMESTAMP - make_interval(mins => %s)
+        """, (run_date, stale_after_minutes))
+        claimed = cur.rowcount > 0
+    conn.commit()
+    conn.close()
+    return claimed
+
+def finish_advisory_run(run_date):
+    conn = get_db_connection()
+    if conn is None: return False
+    with conn.cursor() as cur:
+        cur.execute("UPDATE advisory_runs SET finished_at = CURRENT_TIMESTAMP WHERE run_date = %s", (run_date,))
+    conn.commit()
+    conn.close()
+    return True
+
+def release_advisory_run(run_date):
+    """Drops an unfinished claim so the next check can retry straight away."""
+    conn = get_db_connection()
+    if conn is None: return
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM advisory_runs WHERE run_date = %s AND finished_at IS NULL", (run_date,))
+    conn.commit()
+    conn.close()
+
+def is_advisory_run_finished(run_date):
+    conn = get_db_connection()
+    if conn is None: return False
+    with conn.cursor() as cur:
+        cur.execute("SELECT finished_at IS NOT NULL FROM advisory_runs WHERE run_date = %s", (run_date,))
+        record = cur.fetchone()
+    conn.close()
+    return bool(record and record[0])
+
+def save_district_advisories(rows):
+    """Upserts (district_id, language, digest) rows. Returns False if the database is unavailable."""
+    if not rows: return True
+    conn = get_db_connection()
+    if conn is None: return False
+    with conn.cursor() as cur:
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO district_advisories (district_id, language, digest) VALUES %s
+            ON CONFLICT (district_id, language) DO UPDATE SET
+                digest = EXCLUDED.digest,
+                generated_at = CURRENT_TIMESTAMP;
+        """, rows)
+    conn.commit()
+    conn.close()
+    return True
+
+def get_district_advisory(district_id, language, max_age_hours):
+    conn = get_db_connection()
+    if conn is None: return None
+    digest = None
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT digest FROM district_advisories
+            WHERE district_id = %s AND language = %s
+              AND generated_at > CURRENT_TIMESTAMP - make_interval(hours => %s)
+        """, (district_id, language, max_age_hours))
+        record = cur.fetchone()
+        if record:
+            digest = record[0]
+    conn.close()
+    return digest
+
+def get_advisory_freshness():
+    conn = get_db_connection()
+    if conn is None: return {}
+    freshness = {}
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT COUNT(*), COUNT(DISTINCT district_id),
+                   EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - MIN(generated_at)) / 3600,
+                   EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - MAX(generated_at)) / 3600,
+                   (SELECT MAX(run_date) FROM advisory_runs),
+                   (SELECT MAX(run_date) FROM advisory_runs WHERE finished_at IS NOT NULL)
+            FROM district_advisories
+        """)
+        digests, districts, oldest_hours, newest_hours, last_run, last_finished = cur.fetchone()
+        freshness = {
+            "digests": digests,
+            "districts": districts,
+            "oldest_age_hours": round(float(oldest_hours), 2) if oldest_hours is not None else None,
+            "newest_age_hours": round(float(newest_hours), 2) if newest_hours is not None else None,
+            "last_run_date": str(last_run) if last_run else None,
+            "last_finished_date": str(last_finished) if last_finished else None,
+        }
+    conn.close()
+    return freshness
+
+# --- Deferred Audio Functions ---
+
+def create_deferred_audio(token, text, language_code, profile):
+    conn = get_db_connection()
+    if conn is None: return False
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO deferred_audio (token, text, language_code, profile) VALUES (%s, %s, %s, %s)",
+            (token, text, language_code, profile)
+        )
+    conn.commit()
+    conn.close()
+    return True
+
+def get_deferred_audio(token, max_age_seconds):
+    conn = get_db_connection()
+    if conn is None: return None
+    entry = None
+    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+        cur.execute("""
+            SELECT text, language_code, profile, audio FROM deferred_audio
+            WHERE token = %s AND created_at > CURRENT_TIMESTAMP - make_interval(secs => %s)
+        """, (token, max_age_seconds))
+        record = cur.fetchone()
+        if record:
+            entry = dict(record)
+            if entry["audio"] is not None:
+                entry["audio"] = bytes(entry["audio"])
+    conn.close()
+    return entry
+
+def save_deferred_audio(token, audio):
+    """Keeps the synthesized audio, so retried downloads (from any worker) don't synthesize again."""
+    conn = get_db_connection()
+    if conn is None: return
+    with conn.cursor() as cur:
+        cur.execute("UPDATE deferred_audio SET audio = %s WHERE token = %s", (psycopg2.Binary(audio), token))
+    conn.commit()
+    conn.close()
+
+def delete_expired_deferred_audio(max_age_seconds):
+    conn = get_db_connection()
+    if conn is None: return
+    with conn.cursor() as cur:
+        cur.execute(
+            "DELETE FROM deferred_audio WHERE created_at < CURRENT_TIMESTAMP - make_interval(secs => %s)",
+            (max_age_seconds,)
+        )
+    conn.commit()
+    conn.close()
+
+# --- Custom Search Quota Functions ---
+
+def record_cse_query(usage_date, tool):
+    """Counts one Custom Search query against the day's quota; returns the day's total over all tools."""
+    conn = get_db_connection()
+    if conn is None: return None
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO cse_quota_usage (usage_date, tool, queries) VALUES (%s, %s, 1)
+            ON CONFLICT (usage_date, tool) DO UPDATE SET queries = cse_quota_usage.queries + 1
+        """, (usage_date, tool))
+        cur.execute("SELECT COALESCE(SUM(queries), 0) FROM cse_quota_usage WHERE usage_date = %s", (usage_date,))
+        total = cur.fetchone()[0]
+    conn.commit()
+    conn.close()
+    return total
+
+def get_cse_usage(usage_date):
+    """Returns {tool: queries} for one quota day."""
+    conn = get_db_connection()
+    if conn is None: return {}
+    with conn.cursor() as cur:
+        cur.execute("SELECT tool, queries FROM cse_quota_usage WHERE usage_date = %s", (usage_date,))
+        usage = {tool: queries for tool, queries in cur.fetchall()}
+    conn.close()
+    return usage
+
+if __name__ == "__main__":
+    # Explicit migration step: `python -m backend.database`
+    initialize_db()
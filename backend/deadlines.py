@@ -0,0 +1,90 @@
+# backend/deadlines.py
+
+"""Per-interaction deadlines propagated to every stage through a context variable.
+
+An interaction starts a ``Deadline`` with ``scope()``. Each stage (STT, agent,
+Translate, TTS, and Custom Search inside the agent's tools) then asks for its
+budget: the time left, minus what is reserved for the stages still to come.
+A stage that finishes early hands its unused time to the later ones.
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Optional
+
+from backend.config import settings
+
+# Share of the overall deadline reserved for each pipeline stage, in pipeline order.
+STAGE_ORDER = ("stt", "agent", "translate", "tts")
+STAGE_SHARES = {"stt": 0.2, "agent": 0.5, "translate": 0.1, "tts": 0.2}
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage runs past its budget."""
+
+    def __init__(self, stage: str, budget: float):
+        self.stage = stage
+        self.budget = budget
+        super().__init__(f"Stage '{stage}' did not finish within {budget:.1f}s.")
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.total = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def budget(self, stage: str) -> float:
+        """Time the given stage may use without eating into later stages' share."""
+        remaining = self.remaining()
+        if stage not in STAGE_SHARES:
+            return remaining
+        later = STAGE_ORDER[STAGE_ORDER.index(stage) + 1:]
+        reserve = sum(STAGE_SHARES[s] for s in later) * self.total
+        own_share = STAGE_SHARES[stage] * self.total
+        return min(remaining, max(remaining - reserve, own_share))
+
+
+_current: ContextVar[Optional[Deadline]] = ContextVar("kisan_deadline", default=None)
+
+
+@contextmanager
+def scope(seconds: float = None):
+    """Makes a new deadline current for the duration of the ``with`` block."""
+    deadline = Deadline(settings.interaction_deadline_seconds if seconds is None else seconds)
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def current() -> Optional[Deadline]:
+    return _current.get()
+
+
+def stage_budget(stage: str, cap: float = None) -> Optional[float]:
+    """Budget for a stage under the current deadline, optionally capped.
+
+    Returns ``cap`` when no deadline is active (``None`` means unbounded).
+    """
+    deadline = current()
+    if deadline is None:
+        return cap
+    budget = deadline.budget(stage)
+    return budget if cap is None else min(budget, cap)
+
+
+async def within(stage: str, awaitable: Awaitable, cap: float = None):
+    """Awaits ``awaitable`` under the stage budget, raising ``DeadlineExceeded`` on overrun."""
+    budget = stage_budget(stage, cap)
+    if budget is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout=budget)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(stage, budget)
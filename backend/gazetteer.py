@@ -0,0 +1,200 @@
+# backend/gazetteer.py
+
+"""Canonical place IDs for free-form Indian locations.
+
+``user_location`` arrives as whatever the farmer typed at registration
+("Kolar", "KOLAR", "Bangalore" vs "Bengaluru"). Anything keyed on it (tool
+caches, the mandi price store, district advisories) fragments. This module
+loads ``data/gazetteer.tsv`` once into an in-memory alias index and
+resolves a location string to a canonical ``Place``. Exact and alias hits
+are a dict lookup; misspellings fall back to a fuzzy match within the
+already-resolved state or district.
+
+IDs encode the hierarchy: ``in-ka`` (state), ``in-ka/kolar`` (district),
+``in-ka/kolar/malur`` (town).
+"""
+
+import difflib
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(__file__), "data", "gazetteer.tsv")
+FUZZY_CUTOFF = 0.82
+
+# Words people append to place names that carry no location information.
+_NOISE_WORDS = {"district", "dist", "dt", "city", "town", "village", "taluk", "taluka", "tehsil",
+                "mandi", "market", "apmc", "state", "india"}
+_NON_ALNUM = re.compile(r"[^0-9a-z&]+")
+
+
+@dataclass(frozen=True)
+class Place:
+    id: str
+    name: str
+    kind: str  # "state", "district" or "town"
+
+    @property
+    def state_id(self) -> str:
+        return self.id.split("/")[0]
+
+    @property
+    def district_id(self) -> Optional[str]:
+        parts = self.id.split("/")
+        return "/".join(parts[:2]) if len(parts) >= 2 else None
+
+    @property
+    def parent_id(self) -> Optional[str]:
+        return self.id.rsplit("/", 1)[0] if "/" in self.id else None
+
+
+def normalize_name(text: str) -> str:
+    words = _NON_ALNUM.sub(" ", text.casefold()).split()
+    meaningful = [word for word in words if word not in _NOISE_WORDS]
+    return " ".join(meaningful or words)
+
+
+class Gazetteer:
+    def __init__(self, places: List[Place], aliases: Dict[str, List[str]]):
+        self.places: Dict[str, Place] = {place.id: place for place in places}
+        # normalized name -> ids of every place known by that name
+        self._index: Dict[str, List[str]] = {}
+        for place in places:
+            for name in [place.name] + aliases.get(place.id, []):
+                ids = self._index.setdefault(normalize_name(name), [])
+                if place.id not in ids:
+                    ids.append(place.id)
+        # scope id ("" for the whole country) -> normalized names of its direct children
+        self._children: Dict[str, Dict[str, str]] = {}
+        for key, ids in self._index.items():
+            for place_id in ids:
+                scope = self.places[place_id].parent_id or ""
+                self._children.setdefault(scope, {})[key] = place_id
+
+    @classmethod
+    def load(cls, path: str = GAZETTEER_PATH) -> "Gazetteer":
+        places, aliases = [], {}
+        kinds = {1: "state", 2: "district", 3: "town"}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                place_id, name, alias_field = (line.rstrip("\n").split("\t") + [""])[:3]
+                places.append(Place(place_id, name, kinds[place_id.count("/") + 1]))
+                aliases[place_id] = [alias for alias in alias_field.split("|") if alias]
+        return cls(places, aliases)
+
+    def get(self, place_id: Optional[str]) -> Optional[Place]:
+        return self.places.get(place_id) if place_id else None
+
+    def names(self, place_id: str) -> List[str]:
+        """Normalized name and aliases of one place."""
+        return [key for key, ids in self._index.items() if place_id in ids]
+
+    def _match(self, part: str, scope: str) -> Optional[Place]:
+        """Finds ``part`` below ``scope`` (any depth): exactly first, then fuzzily among the scope's children."""
+        ids = [i for i in self._index.get(part, []) if not scope or i.startswith(scope + "/")]
+        if ids:
+            # Prefer the least specific place: "Kolar" is the district, not a town named after it.
+            return self.places[min(ids, key=lambda i: i.count("/"))]
+        if scope:
+            candidates = self._children.get(scope, {})
+            close = difflib.get_close_matches(part, candidates.keys(), n=1, cutoff=FUZZY_CUTOFF)
+            return self.places[candidates[close[0]]] if close else None
+        # Nothing resolved yet: a misspelling could be any state, district or town.
+        close = difflib.get_close_matches(part, self._index.keys(), n=1, cutoff=FUZZY_CUTOFF)
+        return self._match(close[0], scope) if close else None
+
+    def resolve(self, location: str) -> Optional[Place]:
+        """Resolves a free-form "city, district, state" string to its most specific known place."""
+        parts = [normalize_name(part) for part in location.split(",")]
+        parts = [part for part in parts if part]
+        best: Optional[Place] = None
+        # Walk from the most general part (the state) to the most specific, narrowing the scope.
+        for part in reversed(parts):
+            scope = best.id if best else ""
+            match = self._match(part, scope)
+            if match is None and scope:
+                # e.g. a town we don't know inside a known district: keep the district.
+                continue
+            if match is not None and (best is None or match.id.startswith(best.id + "/")):
+                best = match
+        return best
+
+
+@lru_cache(maxsize=1)
+def get_gazetteer() -> Gazetteer:
+    return Gazetteer.load()
+
+
+@lru_cache(maxsize=4096)
+def resolve(location: str) -> Optional[Place]:
+    """Cached ``Gazetteer.resolve`` on the shared index. Canonical IDs resolve to themselves."""
+    if not location:
+        return None
+    gazetteer = get_gazetteer()
+    return gazetteer.get(location.strip()) or gazetteer.resolve(location)
+
+
+def resolve_specific(location: str) -> Optional[Place]:
+    """``resolve``, but None when only the state is known.
+
+    The gazetteer doesn't list every district, and a bare state is too coarse to
+    stand in for one: callers should keep the text the user typed instead.
+    """
+    place = resolve(location)
+    return place if place is not None and place.kind != "state" else None
+
+
+def _slug(name: str) -> str:
+    return "-".join(name.split())
+
+
+def location_key(location: str) -> str:
+    """Stable cache/storage key for a location: its district ID when known, else the normalized text.
+
+    Never a bare state ID when more specific parts were given: a district missing
+    from the gazetteer becomes ``<state id>/<normalized district>`` (e.g.
+    ``in-up/sitapur``), so weather and prices are not pooled across the state.
+    """
+    place = resolve(location)
+    if place is None:
+        return normalize_name(location.split(",")[0])
+    if place.kind != "state":
+        return place.district_id or place.id
+    # Only the state resolved. Use the unresolved part nearest to it, which is the district.
+    parts = [normalize_name(part) for part in location.split(",")]
+    for part in reversed([part for part in parts if part]):
+        if resolve(part) != place:
+            return f"{place.id}/{_slug(part)}"
+    return normalize_name(location.split(",")[0])
+
+
+@lru_cache(maxsize=4096)
+def names_for_key(key: str) -> Tuple[str, ...]:
+    """Normalized names a ``location_key`` goes by (the place's name and aliases, not its towns')."""
+    gazetteer = get_gazetteer()
+    if key in gazetteer.places:
+        return tuple(gazetteer.names(key))
+    # An unlisted district ("in-up/sitapur") or plain normalized text.
+    return (normalize_name(key.rpartition("/")[2].replace("-", " ")),)
+
+
+def display_name(location: str) -> str:
+    """Canonical, human-readable "Town, District, State" form of a location."""
+    place = resolve(location)
+    gazetteer = get_gazetteer()
+    state_id, _, rest = location.partition("/")
+    if rest and state_id in gazetteer.places and location not in gazetteer.places:
+        # A key from location_key() for a district the gazetteer doesn't list.
+        return f"{rest.replace('-', ' ').title()}, {gazetteer.places[state_id].name}"
+    if place is None:
+        return location
+    names = []
+    place_id = place.id
+    while place_id:
+        names.append(gazetteer.places[place_id].name)
+        place_id = gazetteer.places[place_id].parent_id
+    return ", ".join(names)
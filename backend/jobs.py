@@ -0,0 +1,161 @@
+# backend/jobs.py
+
+"""Asynchronous interaction jobs, persisted in Postgres and run by a bounded worker pool.
+
+``submit`` stores the request (including uploaded media) in ``interaction_jobs``
+and returns straight away. Workers claim jobs with ``FOR UPDATE SKIP LOCKED``
+under a lease, so several API processes can share the queue and a job whose
+worker died is picked up again once its lease runs out. Clients poll or
+long-poll with ``wait_for_job``; results stay available for
+``settings.job_retention_hours``.
+"""
+
+import asyncio
+import time
+import traceback
+import uuid
+from typing import Any, Dict, Optional
+
+from backend import admission, deadlines, metrics, pipeline, database as db
+from backend.config import settings
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+_workers = []
+_wakeup: Optional[asyncio.Event] = None
+_job_events: Dict[str, asyncio.Event] = {}
+
+
+async def submit(request: Dict[str, Any], audio_content: bytes = None, visual_content: bytes = None,
+                 visual_mime_type: str = None, idempotency_key: str = None) -> str:
+    """Persists a new job and returns its id (or the existing id for a repeated idempotency key)."""
+    pending = await asyncio.to_thread(db.count_pending_jobs)
+    if pending >= settings.job_max_pending:
+        metrics.incr("jobs.rejected.queue_full")
+        raise admission.OverloadedError("jobs", "queue_full", settings.overload_retry_after_seconds)
+
+    job_id = await asyncio.to_thread(
+        db.create_job, str(uuid.uuid4()), request, audio_content, visual_content, visual_mime_type, idempotency_key
+    )
+    if job_id is None:
+        raise RuntimeError("Could not persist the job.")
+    metrics.incr("jobs.submitted")
+    if _wakeup is not None:
+        _wakeup.set()
+    return job_id
+
+
+async def wait_for_job(job_id: str, wait_seconds: float = 0) -> Optional[Dict[str, Any]]:
+    """Returns the job, waiting up to ``wait_seconds`` for it to finish (long-polling)."""
+    deadline = time.monotonic() + min(wait_seconds, settings.job_max_long_poll_seconds)
+    event = _job_events.setdefault(job_id, asyncio.Event())
+    try:
+        while True:
+            job = await asyncio.to_thread(db.get_job, job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] in TERMINAL_STATUSES or remaining <= 0:
+                return job
+            # A job finished by this process wakes us at once; one finished by another
+            # process is noticed on the next database check.
+            try:
+                await asyncio.wait_for(event.wait(), timeout=min(remaining, settings.job_poll_interval_seconds))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        if not event.is_set():
+            _job_events.pop(job_id, None)
+
+
+async def _run_job(job: Dict[str, Any]) -> None:
+    job_id = job["id"]
+    request = job["request"]
+    started = time.monotonic()
+    print(f"Job {job_id}: starting attempt {job['attempts']}")
+    try:
+        with deadlines.scope(settings.job_deadline_seconds):
+            result = await pipeline.run_interaction(
+                user_location=request["user_location"],
+                location_id=request.get("location_id"),
+                language_name=request["language_name"],
+                speak_aloud=request["speak_aloud"],
+                text_query=request.get("text_query", ""),
+                audio_content=job["audio_content"],
+                visual_content=job["visual_content"],
+                visual_mime_type=job["visual_mime_type"],
+                bandwidth_profile=request.get("bandwidth_profile", "standard"),
+                user_id=request.get("user_id"),
+            )
+        await asyncio.to_thread(db.finish_job, job_id, "succeeded", result)
+        metrics.incr("jobs.succeeded")
+    except admission.OverloadedError as e:
+        # Upstreams are saturated: hand the job back and let the queue absorb the burst.
+        print(f"Job {job_id}: {e}; requeueing")
+        metrics.incr("jobs.requeued")
+        await asyncio.to_thread(db.requeue_job, job_id)
+        await asyncio.sleep(e.retry_after)
+        return
+    except pipeline.EmptyQueryError as e:
+        await asyncio.to_thread(db.finish_job, job_id, "failed", {"ai_response": e.message, "degraded": e.degraded_stages}, e.message)
+        metrics.incr("jobs.failed")
+    except Exception as e:
+        print(f"Job {job_id} failed: {e}")
+        traceback.print_exc()
+        await asyncio.to_thread(db.finish_job, job_id, "failed", None, "An internal server error occurred.")
+        metrics.incr("jobs.failed")
+    finally:
+        metrics.observe("jobs.run_seconds", time.monotonic() - started)
+
+    event = _job_events.get(job_id)
+    if event is not None:
+        event.set()
+        _job_events.pop(job_id, None)
+
+
+async def _worker_loop(worker_number: int) -> None:
+    last_sweep = last_cleanup = 0.0
+    while True:
+        try:
+            if worker_number == 0 and time.monotonic() - last_sweep > settings.job_sweep_interval_seconds:
+                last_sweep = time.monotonic()
+                await asyncio.to_thread(db.fail_exhausted_jobs, settings.job_max_attempts)
+            if worker_number == 0 and time.monotonic() - last_cleanup > 3600:
+                last_cleanup = time.monotonic()
+                await asyncio.to_thread(db.delete_finished_jobs, settings.job_retention_hours)
+                await asyncio.to_thread(db.delete_expired_deferred_audio, settings.deferred_audio_ttl_seconds)
+
+            job = await asyncio.to_thread(
+                db.claim_next_job, settings.job_deadline_seconds * 2, settings.job_max_attempts
+            )
+            if job is None:
+                _wakeup.clear()
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), timeout=settings.job_poll_interval_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await _run_job(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Job worker {worker_number} error: {e}")
+            await asyncio.sleep(settings.job_poll_interval_seconds)
+
+
+def start_workers() -> None:
+    global _wakeup
+    if _workers:
+        return
+    _wakeup = asyncio.Event()
+    for number in range(settings.job_workers):
+        _workers.append(asyncio.create_task(_worker_loop(number)))
+    print(f"Started {settings.job_workers} job workers.")
+
+
+async def stop_workers() -> None:
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+
+metrics.register_collector("jobs", lambda: {"workers": len(_workers), "waiters": len(_job_events)})
@@ -1,18 +1,41 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, status
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, Form, Header, HTTPException, Depends, Request, status
+from fastapi.responses import JSONResponse, Response
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
-from typing import Optional
-import base64
+from typing import List, Optional
+from datetime import date, timedelta
+from contextlib import asynccontextmanager
+import asyncio
 import traceback
-import asyncio 
-from backend import ai_services, audio_services, database as db
-from backend import translation_services
-from backend.utils import get_language_codes
+from backend import database as db
+from backend import admission, advisories, bandwidth, batch, deadlines, gazetteer, jobs, market_prices, metrics, pipeline, sessions, uploads
+from backend.config import settings
 
-db.initialize_db()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema setup runs here rather than at import time. With many workers, turn it off
+    # (RUN_MIGRATIONS_ON_STARTUP=false) and run `python -m backend.database` once per deploy.
+    if settings.run_migrations_on_startup:
+        await asyncio.to_thread(db.initialize_db)
+    jobs.start_workers()
+    sessions.start_compactor()
+    advisories.start_scheduler()
+    yield
+    await advisories.stop_scheduler()
+    await sessions.stop_compactor()
+    await jobs.stop_workers()
 
-app = FastAPI(title="Project Kisan API", version="1.0.0")
+app = FastAPI(title="Project Kisan API", version="1.0.0", lifespan=lifespan)
+app.add_middleware(uploads.UploadSizeLimitMiddleware)
+
+@app.exception_handler(admission.OverloadedError)
+async def overloaded_exception_handler(request, exc: admission.OverloadedError):
+    print(f"Rejecting request: {exc}")
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"error": "The service is busy right now. Please try again shortly.", "upstream": exc.upstream},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 class UserRegistration(BaseModel):
     name: str
@@ -21,21 +44,34 @@ class UserRegistration(BaseModel):
     city: str
     password: str
 
+class BatchQueryItem(BaseModel):
+    user_id: Optional[str] = None
+    user_location: str
+    language_name: str = "English"
+    text_query: str
+
+class BatchQueryRequest(BaseModel):
+    items: List[BatchQueryItem]
+
 class UserInfo(BaseModel):
     id: int
     name: str
     state: str
     district: str
     city: str
+    location_id: Optional[str] = None
 
 @app.post("/register", status_code=status.HTTP_201_CREATED)
 def register_user_endpoint(user_data: UserRegistration):
+    # The canonical location is fixed once here, so caches and stores key on it consistently.
+    place = gazetteer.resolve_specific(f"{user_data.city}, {user_data.district}, {user_data.state}")
     success = db.register_user(
         name=user_data.name,
         state=user_data.state,
         district=user_data.district,
         city=user_data.city,
-        password=user_data.password
+        password=user_data.password,
+        location_id=place.id if place else None,
     )
     if not success:
         raise HTTPException(
@@ -59,103 +95,190 @@ def login_user_endpoint(form_data: OAuth2PasswordRequestForm = Depends()):
 # --- OPTIMIZED & ASYNC-AWARE INTERACTION ENDPOINT ---
 @app.post("/process-interaction/")
 async def process_user_interaction(
+    request: Request,
     user_location: str = Form(...),
     language_name: str = Form(...),
     speak_aloud: bool = Form(...),
     audio_file: Optional[UploadFile] = File(None),
     text_query: Optional[str] = Form(""),
     visual_file: Optional[UploadFile] = File(None),
+    location_id: Optional[str] = Form(None),
+    bandwidth_profile: Optional[str] = Form("standard"),
+    defer_audio: bool = Form(False),
+    user_id: Optional[str] = Form(None),
 ):
-    try:
-        lang_codes = get_language_codes(language_name)
-        transcribed_text = ""
-        
-        print(f"\n--- Incoming Request for {user_location} ---")
-
-        # 1. Handle audio input (non-blocking)
-        if audio_file and audio_file.filename:
-            audio_content = await audio_file.read()
-            if len(audio_content) > 100:
-                print("Processing audio transcription in background thread...")
-                # Run synchronous, blocking STT call in a thread to not block the server
-                transcribed_text = await asyncio.to_thread(
-                    audio_services.transcribe_audio, audio_content, lang_codes["stt"]
+    with deadlines.scope() as deadline:
+        async with admission.limiter("interaction").slot(max_wait=deadline.remaining()):
+            try:
+                print(f"\n--- Incoming Request for {user_location} ---")
+                audio_content = uploads.open_upload(audio_file, "audio")
+                visual_content = uploads.open_upload(visual_file, "image")
+                result = await pipeline.run_interaction(
+                    user_location=user_location,
+                    location_id=location_id,
+                    language_name=language_name,
+                    speak_aloud=speak_aloud,
+                    text_query=text_query,
+                    audio_content=audio_content,
+                    visual_content=visual_content,
+                    visual_mime_type=visual_file.content_type if visual_content else None,
+                    bandwidth_profile=bandwidth_profile,
+                    defer_audio=defer_audio,
+                    user_id=user_id,
                 )
-                transcribed_text = transcribed_text.strip() if transcribed_text else ""
-                print(f"Transcription result: '{transcribed_text}'")
-            else:
-                print("Audio file too small, skipping transcription")
-
-        # 2. Determine the effective prompt for AI
-        effective_prompt = transcribed_text or text_query.strip()
-        print(f"Effective prompt: '{effective_prompt}'")
-
-        # 3. Validate if any meaningful query was provided
-        if not effective_prompt and not visual_file:
-            return JSONResponse(
-                status_code=400,
-                content={"ai_response": "Please provide a voice message, text query, or an image."}
-            )
-
-        # 4. Process the query with AI services 
-        ai_response_english = ""
-        user_info_for_ai = {"location": user_location} 
-        
+                return bandwidth.compact_json_response(request, result)
+
+            except pipeline.EmptyQueryError as e:
+                if e.degraded_stages:
+                    return bandwidth.compact_json_response(request, {
+                        "query_transcript": "",
+                        "ai_response": e.message,
+                        "audio_output_b64": None,
+                        "audio_url": None,
+                        "audio_mime_type": None,
+                        "degraded": e.degraded_stages,
+                    })
+                return JSONResponse(status_code=400, content={"ai_response": e.message})
+            except (admission.OverloadedError, HTTPException):
+                raise
+            except Exception as e:
+                print(f"Unexpected error in process_user_interaction: {e}")
+                traceback.print_exc()
+                return JSONResponse(status_code=500, content={"error": "An internal server error occurred."})
+
+# --- BATCH ENDPOINT FOR SMS/IVR GATEWAYS ---
+@app.post("/batch/queries")
+async def process_batch_queries(request: BatchQueryRequest, http_request: Request):
+    if len(request.items) > settings.batch_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"A batch may contain at most {settings.batch_max_items} items.",
+        )
+    print(f"\n--- Incoming batch of {len(request.items)} queries ---")
+    results = await batch.run_batch([item.model_dump() for item in request.items])
+    return bandwidth.compact_json_response(http_request, {"results": results})
+
+# --- ASYNCHRONOUS JOB ENDPOINTS ---
+# For heavy image/voice interactions and flaky connections: submit once, then poll.
+# Resubmitting with the same Idempotency-Key returns the original job instead of a duplicate.
+
+def _job_view(job):
+    view = {"job_id": job["id"], "status": job["status"]}
+    if job["status"] == "succeeded":
+        view["result"] = job["result"]
+    elif job["status"] == "failed":
+        view["error"] = job["error"]
+        if job["result"]:
+            view["result"] = job["result"]
+    return view
+
+@app.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_job(
+    user_location: str = Form(...),
+    language_name: str = Form(...),
+    speak_aloud: bool = Form(...),
+    audio_file: Optional[UploadFile] = File(None),
+    text_query: Optional[str] = Form(""),
+    visual_file: Optional[UploadFile] = File(None),
+    location_id: Optional[str] = Form(None),
+    bandwidth_profile: Optional[str] = Form("standard"),
+    user_id: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None),
+):
+    # Jobs are stored in Postgres, so their media is read in full here.
+    audio_content = await asyncio.to_thread(uploads.read_media, uploads.open_upload(audio_file, "audio"))
+    visual_content = await asyncio.to_thread(uploads.read_media, uploads.open_upload(visual_file, "image"))
+    if not audio_content and not visual_content and not (text_query or "").strip():
+        raise HTTPException(status_code=400, detail="Please provide a voice message, text query, or an image.")
+
+    job_id = await jobs.submit(
+        request={
+            "user_location": user_location,
+            "location_id": location_id,
+            "language_name": language_name,
+            "speak_aloud": speak_aloud,
+            "text_query": text_query or "",
+            "bandwidth_profile": bandwidth_profile,
+            "user_id": user_id,
+        },
+        audio_content=audio_content,
+        visual_content=visual_content,
+        visual_mime_type=visual_file.content_type if visual_content else None,
+        idempotency_key=idempotency_key,
+    )
+    return {"job_id": job_id, "status_url": f"/jobs/{job_id}"}
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, request: Request, wait: float = 0):
+    """Returns the job's status, and its result once finished. ``wait`` long-polls for up to that many seconds."""
+    job = await jobs.wait_for_job(job_id, wait_seconds=max(wait, 0))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return bandwidth.compact_json_response(request, _job_view(job))
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, request: Request):
+    job = await jobs.wait_for_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    if job["status"] not in jobs.TERMINAL_STATUSES:
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content=_job_view(job),
+            headers={"Retry-After": str(int(settings.job_poll_interval_seconds))},
+        )
+    if job["status"] == "failed" and not job["result"]:
+        return JSONResponse(status_code=500, content=_job_view(job))
+    return bandwidth.compact_json_response(request, job["result"])
+
+# --- DEFERRED AUDIO ---
+
+@app.get("/audio/{token}")
+async def get_deferred_audio(token: str):
+    """Synthesizes (once) and returns the spoken answer for an interaction sent with ``defer_audio``."""
+    with deadlines.scope():
         try:
-            if visual_file:
-                print("Processing visual query with AI...")
-                visual_content = await visual_file.read()
-                ai_response_english = await ai_services.analyze_visuals(
-                    prompt=effective_prompt, 
-                    media_content=visual_content, 
-                    mime_type=visual_file.content_type, 
-                    user_info=user_info_for_ai
-                )
-            elif effective_prompt:
-                print("Processing text query with AI...")
-                ai_response_english = await ai_services.get_gemini_response(effective_prompt, user_info_for_ai)
-            else:
-                 ai_response_english = "I see you've uploaded an image. Could you please ask a question about it so I can help you better?"
-            
-            print(f"AI Response (English): '{ai_response_english[:100]}...'")
-
-        except Exception as e:
-            print(f"ERROR: AI service failed: {e}")
-            ai_response_english = "I apologize, but I encountered an error while processing your request."
-
-        # 5. Translate response if needed
-        if language_name != "English" and ai_response_english:
-            print(f"Translating response to {language_name} in background thread...")
-            translated_response = await asyncio.to_thread(
-                translation_services.translate_text, ai_response_english, lang_codes["translate"]
-            )
-        else:
-            translated_response = ai_response_english
-        
-        print(f"Final response: '{translated_response[:100]}...'")
-
-        # 6. Synthesize speech if requested 
-        audio_output_b64 = None
-        if speak_aloud and translated_response:
-            print("Synthesizing speech in background thread...")
-            audio_output_bytes = await asyncio.to_thread(
-                audio_services.synthesize_speech, translated_response, lang_codes["tts"]
-            )
-            if audio_output_bytes:
-                audio_output_b64 = base64.b64encode(audio_output_bytes).decode('utf-8')
-                print("Speech synthesis successful")
-
-        # 7. Return final response
-        return JSONResponse(content={
-            "query_transcript": transcribed_text,
-            "ai_response": translated_response,
-            "audio_output_b64": audio_output_b64,
-        })
-
-    except Exception as e:
-        print(f"Unexpected error in process_user_interaction: {e}")
-        traceback.print_exc()
-        return JSONResponse(status_code=500, content={"error": "An internal server error occurred."})
+            audio = await bandwidth.fetch_deferred_audio(token)
+        except deadlines.DeadlineExceeded:
+            raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Speech synthesis timed out.")
+    if audio is None:
+        raise HTTPException(status_code=404, detail="Audio not found or expired.")
+    content, mime_type = audio
+    return Response(content=content, media_type=mime_type, headers={"Cache-Control": "private, max-age=600"})
+
+# --- MANDI PRICE QUERY ENDPOINTS ---
+
+@app.get("/prices/latest")
+def get_latest_price(crop: str, market: str):
+    price = db.get_latest_mandi_price(market_prices.normalize_crop(crop), market_prices.normalize_market(market))
+    if price is None:
+        raise HTTPException(status_code=404, detail="No recorded prices for this crop and market.")
+    return price
+
+@app.get("/prices/range")
+def get_price_range(crop: str, market: str, start: date, end: Optional[date] = None):
+    return db.get_mandi_price_range(
+        market_prices.normalize_crop(crop), market_prices.normalize_market(market), start, end or date.today()
+    )
+
+@app.get("/prices/trend")
+def get_price_trend(crop: str, market: str, days: int = 30):
+    end = date.today()
+    rows = db.get_mandi_price_range(
+        market_prices.normalize_crop(crop), market_prices.normalize_market(market), end - timedelta(days=days), end
+    )
+    return {"trend": market_prices.summarize_trend(rows), "daily": rows}
+
+@app.get("/advisories/{location_id:path}")
+def get_advisory(location_id: str, language: str = "English"):
+    digest = advisories.get_digest(location_id, language)
+    if digest is None:
+        raise HTTPException(status_code=404, detail="No current advisory for this location.")
+    return {"location_id": location_id, "language": language, "digest": digest}
+
+@app.get("/metrics")
+def read_metrics():
+    return metrics.snapshot()
 
 @app.get("/")
 def read_root(): 
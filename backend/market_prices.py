@@ -0,0 +1,169 @@
+# backend/market_prices.py
+
+"""Structured mandi price records parsed from Custom Search snippets.
+
+``get_market_prices`` used to hand the raw snippets to the model and forget
+them. Now each snippet is parsed into a price record (crop, market,
+min/max/modal price in Rs/quintal, date) and stored in the date-partitioned
+``mandi_prices`` table. Repeat questions, and trend questions, are answered
+from that table instead of a fresh web search.
+
+Stored records are served as the mandi rate, so a snippet is only kept
+when it is dated and names both the crop and the market. Snippets about
+MSP or other support prices are skipped.
+"""
+
+import re
+from dataclasses import dataclass, asdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from backend import gazetteer
+
+_AMOUNT = r"(?:rs\.?|₹|inr)?\s*([\d,]+(?:\.\d+)?)"
+_PRICE_PATTERNS = {
+    "min_price": re.compile(r"\bmin(?:imum)?\.?(?:\s+price)?\s*(?:is|:|-|of|=)?\s*" + _AMOUNT, re.I),
+    "max_price": re.compile(r"\bmax(?:imum)?\.?(?:\s+price)?\s*(?:is|:|-|of|=)?\s*" + _AMOUNT, re.I),
+    "modal_price": re.compile(r"\b(?:modal|average|avg\.?)(?:\s+price)?\s*(?:is|:|-|of|=)?\s*" + _AMOUNT, re.I),
+}
+_ANY_PRICE = re.compile(r"(?:rs\.?|₹|inr)\s*([\d,]+(?:\.\d+)?)", re.I)
+_PER_KG = re.compile(r"(?:/|per)\s*kg\b", re.I)
+_SUPPORT_PRICE = re.compile(r"\bmsp\b|\bsupport\s+price", re.I)
+
+_MONTHS = "jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec"
+_DATE_PATTERNS = [
+    (re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b"), ("%Y-%m-%d", "{0}-{1}-{2}")),
+    (re.compile(r"\b(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})\b"), ("%d-%m-%Y", "{0}-{1}-{2}")),
+    (re.compile(rf"\b(\d{{1,2}})(?:st|nd|rd|th)?\s+({_MONTHS})[a-z]*,?\s+(\d{{4}})\b", re.I), ("%d %b %Y", "{0} {1} {2}")),
+    (re.compile(rf"\b({_MONTHS})[a-z]*\s+(\d{{1,2}}),?\s+(\d{{4}})\b", re.I), ("%b %d %Y", "{0} {1} {2}")),
+]
+
+
+@dataclass
+class PriceRecord:
+    crop: str
+    market: str
+    price_date: date
+    min_price: Optional[float]
+    max_price: Optional[float]
+    modal_price: Optional[float]
+    source_url: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        record = asdict(self)
+        record["price_date"] = self.price_date.isoformat()
+        return record
+
+
+def normalize_crop(crop: str) -> str:
+    return " ".join(crop.lower().split())
+
+
+def normalize_market(location: str) -> str:
+    """Keys markets by canonical district ID, so "Nasik" and "Nashik, Maharashtra" share records."""
+    return gazetteer.location_key(location)
+
+
+def _to_number(text: str) -> float:
+    return float(text.replace(",", ""))
+
+
+def _parse_date(text: str, today: date) -> Optional[date]:
+    """The snippet's own price date, or None. Undated snippets are never stamped with today."""
+    for pattern, (fmt, template) in _DATE_PATTERNS:
+        match = pattern.search(text)
+        if not match:
+            continue
+        parts = [part[:3] if part.isalpha() else part for part in match.groups()]
+        try:
+            parsed = datetime.strptime(template.format(*parts), fmt).date()
+        except ValueError:
+            continue
+        # Ignore obviously wrong dates (typos, future dates, stale archive pages).
+        if today - timedelta(days=366) <= parsed <= today:
+            return parsed
+    return None
+
+
+def _mentions_crop(text: str, crop: str) -> bool:
+    lowered = text.lower()
+    return all(word in lowered for word in normalize_crop(crop).split())
+
+
+def _mentions_market(text: str, market: str) -> bool:
+    words = f" {gazetteer.normalize_name(text)} "
+    return any(f" {name} " in words for name in gazetteer.names_for_key(market))
+
+
+def parse_price_snippet(text: str, crop: str, market: str, source_url: str = "", today: date = None) -> Optional[PriceRecord]:
+    """Extracts a price record from one search snippet, or None if it holds no dated price.
+
+    ``market`` is a ``normalize_market`` key; snippets about another crop or
+    market, or about support prices, yield None.
+    """
+    if _SUPPORT_PRICE.search(text) or not _mentions_crop(text, crop) or not _mentions_market(text, market):
+        return None
+    today = today or date.today()
+    price_date = _parse_date(text, today)
+    if price_date is None:
+        return None
+
+    prices = {}
+    for field, pattern in _PRICE_PATTERNS.items():
+        match = pattern.search(text)
+        if match:
+            prices[field] = _to_number(match.group(1))
+
+    if not prices:
+        match = _ANY_PRICE.search(text)
+        if not match:
+            return None
+        prices["modal_price"] = _to_number(match.group(1))
+
+    # Normalise to Rs/quintal, the unit mandis report in.
+    if _PER_KG.search(text):
+        prices = {field: value * 100 for field, value in prices.items()}
+
+    if "modal_price" not in prices and "min_price" in prices and "max_price" in prices:
+        prices["modal_price"] = round((prices["min_price"] + prices["max_price"]) / 2, 2)
+
+    return PriceRecord(
+        crop=normalize_crop(crop),
+        market=market,
+        price_date=price_date,
+        min_price=prices.get("min_price"),
+        max_price=prices.get("max_price"),
+        modal_price=prices.get("modal_price"),
+        source_url=source_url,
+    )
+
+
+def parse_search_items(items: List[Dict[str, Any]], crop: str, market: str, today: date = None) -> List[PriceRecord]:
+    records = []
+    for item in items:
+        text = f"{item.get('title', '')}. {item.get('snippet', '')}".replace("\n", " ")
+        record = parse_price_snippet(text, crop, market, item.get("link", ""), today)
+        if record:
+            records.append(record)
+    return records
+
+
+def summarize_trend(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Turns daily rows (oldest first) from ``get_mandi_price_range`` into a trend summary."""
+    series = [row for row in rows if row.get("modal_price") is not None]
+    if not series:
+        return {"points": 0}
+    first, last = series[0], series[-1]
+    first_price, last_price = float(first["modal_price"]), float(last["modal_price"])
+    change = last_price - first_price
+    return {
+        "points": len(series),
+        "from_date": str(first["price_date"]),
+        "to_date": str(last["price_date"]),
+        "start_modal_price": first_price,
+        "latest_modal_price": last_price,
+        "change": round(change, 2),
+        "change_percent": round(change / first_price * 100, 1) if first_price else None,
+        "lowest": min(float(row["modal_price"]) for row in series),
+        "highest": max(float(row["modal_price"]) for row in series),
+    }
@@ -0,0 +1,64 @@
+# backend/metrics.py
+
+"""Lightweight in-process metrics exposed on the ``/metrics`` endpoint.
+
+Counters are monotonically increasing numbers, observations keep a running
+count/sum/min/max/last for a value such as a latency, and collectors are
+callables polled at snapshot time for gauges that live elsewhere (e.g. the
+admission limiters' queue depth).
+"""
+
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = defaultdict(float)
+_observations: Dict[str, Dict[str, float]] = {}
+_collectors: Dict[str, Callable[[], Any]] = {}
+
+
+def incr(name: str, value: float = 1) -> None:
+    """Increments a counter."""
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name: str, value: float) -> None:
+    """Records one observation of a value."""
+    with _lock:
+        stats = _observations.get(name)
+        if stats is None:
+            _observations[name] = {"count": 1, "sum": value, "min": value, "max": value, "last": value}
+            return
+        stats["count"] += 1
+        stats["sum"] += value
+        stats["min"] = min(stats["min"], value)
+        stats["max"] = max(stats["max"], value)
+        stats["last"] = value
+
+
+def register_collector(name: str, collector: Callable[[], Any]) -> None:
+    """Registers a callable whose return value is reported under ``name``."""
+    with _lock:
+        _collectors[name] = collector
+
+
+def snapshot() -> Dict[str, Any]:
+    """Returns a JSON-serialisable view of all metrics."""
+    with _lock:
+        counters = dict(_counters)
+        observations = {
+            name: {**stats, "avg": stats["sum"] / stats["count"]}
+            for name, stats in _observations.items()
+        }
+        collectors = dict(_collectors)
+
+    gauges = {}
+    for name, collector in collectors.items():
+        try:
+            gauges[name] = collector()
+        except Exception as e:
+            gauges[name] = {"error": str(e)}
+
+    return {"counters": counters, "observations": observations, "gauges": gauges}
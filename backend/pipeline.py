@@ -0,0 +1,171 @@
+# backend/pipeline.py
+
+"""The voice/text/image interaction pipeline: STT -> agent -> Translate -> TTS.
+
+Shared by the synchronous ``/process-interaction/`` endpoint and the
+background job workers, so both paths get the same admission limits,
+deadline budgets and degradation behaviour.
+"""
+
+import asyncio
+import base64
+from typing import Any, Dict, Optional
+
+from backend import ai_services, audio_services, translation_services, admission, bandwidth, deadlines, gazetteer, uploads
+from backend.utils import get_language_codes
+
+
+class EmptyQueryError(Exception):
+    """Raised when an interaction has no usable voice, text or image input."""
+
+    def __init__(self, message: str, degraded_stages=None):
+        self.message = message
+        self.degraded_stages = degraded_stages or []
+        super().__init__(message)
+
+
+async def _ask_agent(prompt: str, visual_content: Optional[uploads.Media], visual_mime_type: Optional[str], user_info: Dict[str, Any]) -> str:
+    async with admission.limiter("agent").slot():
+        if visual_content:
+            return await ai_services.analyze_visuals(
+                prompt=prompt,
+                media_content=await asyncio.to_thread(uploads.read_media, visual_content),
+                mime_type=visual_mime_type,
+                user_info=user_info
+            )
+        return await ai_services.get_gemini_response(prompt, user_info)
+
+
+async def run_interaction(
+    user_location: str,
+    language_name: str,
+    speak_aloud: bool,
+    text_query: str = "",
+    audio_content: Optional[uploads.Media] = None,
+    visual_content: Optional[uploads.Media] = None,
+    visual_mime_type: Optional[str] = None,
+    location_id: Optional[str] = None,
+    bandwidth_profile: str = "standard",
+    defer_audio: bool = False,
+    user_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Runs one interaction under the current deadline and returns the response payload.
+
+    ``audio_content`` and ``visual_content`` may be bytes or (spooled) file handles;
+    they are only read in full by the stage that sends them upstream.
+    ``bandwidth_profile`` and ``defer_audio`` control the spoken answer (see
+    ``backend.bandwidth``). Conversation history is kept only for requests
+    that carry the registered ``user_id``.
+    """
+    lang_codes = get_language_codes(language_name)
+    transcribed_text = ""
+    degraded_stages = []
+
+    # 1. Handle audio input (non-blocking)
+    if audio_content:
+        if uploads.media_size(audio_content) > 100:
+            print("Processing audio transcription in background thread...")
+            # Run synchronous, blocking STT call in a thread to not block the server
+            try:
+                transcribed_text = await deadlines.within("stt", admission.run_blocking(
+                    "stt", audio_services.transcribe_audio, audio_content, lang_codes["stt"],
+                    timeout=deadlines.stage_budget("stt"),
+                ))
+            except deadlines.DeadlineExceeded as e:
+                print(f"Degrading: {e}")
+                degraded_stages.append("stt")
+                transcribed_text = ""
+            transcribed_text = transcribed_text.strip() if transcribed_text else ""
+            print(f"Transcription result: '{transcribed_text}'")
+        else:
+            print("Audio file too small, skipping transcription")
+
+    # 2. Determine the effective prompt for AI
+    effective_prompt = transcribed_text or (text_query or "").strip()
+    print(f"Effective prompt: '{effective_prompt}'")
+
+    # 3. Validate if any meaningful query was provided
+    if not effective_prompt and not visual_content:
+        if "stt" in degraded_stages:
+            raise EmptyQueryError(
+                "Sorry, I couldn't process your voice message in time. Please try again or type your question.",
+                degraded_stages,
+            )
+        raise EmptyQueryError("Please provide a voice message, text query, or an image.")
+
+    # 4. Process the query with AI services
+    ai_response_english = ""
+    # A state-only match (an unlisted district, or a location_id stored that way)
+    # keeps the city and district the user typed.
+    place = gazetteer.resolve_specific(location_id or user_location)
+    user_info_for_ai = {
+        "location": gazetteer.display_name(place.id) if place else user_location,
+        "location_id": place.id if place else None,
+    }
+    if user_id:
+        user_info_for_ai["id"] = user_id
+
+    try:
+        if visual_content or effective_prompt:
+            print(f"Processing {'visual' if visual_content else 'text'} query with AI...")
+            ai_response_english = await deadlines.within(
+                "agent", _ask_agent(effective_prompt, visual_content, visual_mime_type, user_info_for_ai)
+            )
+        else:
+             ai_response_english = "I see you've uploaded an image. Could you please ask a question about it so I can help you better?"
+
+        print(f"AI Response (English): '{ai_response_english[:100]}...'")
+
+    except admission.OverloadedError:
+        raise
+    except deadlines.DeadlineExceeded as e:
+        print(f"Degrading: {e}")
+        degraded_stages.append("agent")
+        ai_response_english = "I'm taking longer than usual to answer right now. Please try again in a moment."
+    except Exception as e:
+        print(f"ERROR: AI service failed: {e}")
+        ai_response_english = "I apologize, but I encountered an error while processing your request."
+
+    # 5. Translate response if needed
+    if language_name != "English" and ai_response_english:
+        print(f"Translating response to {language_name} in background thread...")
+        try:
+            translated_response = await deadlines.within("translate", admission.run_blocking(
+                "translate", translation_services.translate_text, ai_response_english, lang_codes["translate"]
+            ))
+        except deadlines.DeadlineExceeded as e:
+            # An English answer beats no answer.
+            print(f"Degrading: {e}")
+            degraded_stages.append("translate")
+            translated_response = ai_response_english
+    else:
+        translated_response = ai_response_english
+
+    print(f"Final response: '{translated_response[:100]}...'")
+
+    # 6. Synthesize speech if requested (or hand back a URL that will)
+    profile = bandwidth.get_profile(bandwidth_profile)
+    audio_output_b64 = None
+    audio_url = None
+    if speak_aloud and translated_response and defer_audio:
+        audio_url = await bandwidth.defer_audio(translated_response, lang_codes["tts"], profile)
+    if speak_aloud and translated_response and not audio_url:
+        print(f"Synthesizing speech ({profile.audio_encoding}) in background thread...")
+        try:
+            audio_output_bytes = await bandwidth.synthesize(translated_response, lang_codes["tts"], profile)
+        except deadlines.DeadlineExceeded as e:
+            print(f"Degrading: {e}")
+            degraded_stages.append("tts")
+            audio_output_bytes = None
+        if audio_output_bytes:
+            audio_output_b64 = base64.b64encode(audio_output_bytes).decode('utf-8')
+            print("Speech synthesis successful")
+
+    return {
+        "query_transcript": transcribed_text,
+        "ai_response": translated_response,
+        "audio_output_b64": audio_output_b64,
+        "audio_url": audio_url,
+        "audio_mime_type": profile.audio_mime_type if (audio_output_b64 or audio_url) else None,
+        "degraded": degraded_stages,
+    }
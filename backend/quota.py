@@ -0,0 +1,188 @@
+# backend/quota.py
+
+"""Shared Custom Search quota, spent by priority and paced over the day.
+
+The market price, weather and scheme tools share one hard daily Custom
+Search quota, which resets at midnight Pacific time. Every query goes
+through ``acquire``, which checks two limits:
+
+* The **daily budget** (``settings.cse_daily_query_budget``) is counted
+  in the ``cse_quota_usage`` table, so all API processes share it and the
+  per-tool totals double as cost accounting.
+* A **token bucket** of ``settings.cse_quota_burst`` queries refills at
+  the rate that spends the remaining budget evenly until the reset,
+  multiplied by ``settings.cse_quota_pacing_factor``. Peaks are absorbed,
+  but one busy morning cannot spend the whole day's quota. Each process
+  keeps its own bucket, so burst and rate are divided by
+  ``settings.api_workers``. The deployment as a whole then paces at the
+  configured rate.
+
+Lower-priority tools are refused earlier: each priority keeps back a share
+of both the budget and the bucket for the tools above it. A 429 from Custom
+Search usually means the per-minute rate limit. It pauses queries for a
+short, growing backoff. Only a 429 whose reason names the daily limit marks
+the quota exhausted until the reset. A refused tool raises
+``QuotaExhausted``. The tools then fall back to stale cached
+data or tell the agent to answer from its own knowledge.
+"""
+
+import asyncio
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+from backend import metrics, database as db
+from backend.config import settings
+
+QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+
+HIGH, NORMAL, LOW = 0, 1, 2
+TOOL_PRIORITIES = {"market_prices": HIGH, "weather": NORMAL, "schemes": LOW}
+# Share of the daily budget and of the bucket held back from each priority.
+_RESERVES = {HIGH: 0.0, NORMAL: 0.05, LOW: 0.20}
+
+
+class QuotaExhausted(Exception):
+    """Raised when a tool may not spend Custom Search quota right now."""
+
+    def __init__(self, tool: str, reason: str):
+        self.tool = tool
+        self.reason = reason
+        super().__init__(f"Custom Search quota unavailable for '{tool}' ({reason})")
+
+
+def _quota_day():
+    return datetime.now(QUOTA_TIMEZONE).date()
+
+
+def _seconds_until_reset() -> float:
+    now = datetime.now(QUOTA_TIMEZONE)
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (midnight - now).total_seconds()
+
+
+class QuotaManager:
+    def __init__(self, daily_budget: int, burst: int, pacing_factor: float, workers: int = 1):
+        self.daily_budget = daily_budget
+        self.workers = max(workers, 1)
+        self.burst = max(burst / self.workers, 1.0)
+        self.pacing_factor = pacing_factor
+        self._day = None
+        self._used = 0
+        self._exhausted = False
+        self._backoff = 0.0
+        self._backoff_until = 0.0
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+        self._queries = Counter()  # this process, today
+
+    async def _roll_over(self) -> None:
+        today = _quota_day()
+        if self._day == today:
+            return
+        self._day = today
+        self._used = 0
+        self._exhausted = False
+        self._queries.clear()
+        usage = await asyncio.to_thread(db.get_cse_usage, today)
+        self._used = max(self._used, sum(usage.values()))
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        remaining = max(self.daily_budget - self._used, 0)
+        rate = remaining / max(_seconds_until_reset(), 60) * self.pacing_factor / self.workers
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+
+    async def acquire(self, tool: str) -> None:
+        """Spends one query for ``tool`` or raises ``QuotaExhausted``."""
+        await self._roll_over()
+        self._refill()
+        reserve = _RESERVES[TOOL_PRIORITIES.get(tool, LOW)]
+        if self._exhausted:
+            reason = "daily_limit_429"
+        elif time.monotonic() < self._backoff_until:
+            reason = "rate_limit_429"
+        elif self.daily_budget - self._used < 1 + reserve * self.daily_budget:
+            reason = "daily_budget"
+        elif self._tokens < 1 + reserve * self.burst:
+            reason = "rate"
+        else:
+            self._tokens -= 1
+            self._used += 1
+            self._queries[tool] += 1
+            metrics.incr(f"cse_quota.queries.{tool}")
+            total = await asyncio.to_thread(db.record_cse_query, self._day, tool)
+            if total is not None:
+                self._used = max(self._used, total)
+            return
+        metrics.incr(f"cse_quota.refused.{tool}.{reason}")
+        raise QuotaExhausted(tool, reason)
+
+    def record_429(self, daily_limit: bool, retry_after: Optional[float] = None) -> None:
+        """Custom Search answered 429: stop until the reset (daily limit) or back off briefly (rate limit)."""
+        if daily_limit:
+            if not self._exhausted:
+                print("Custom Search daily quota exhausted (429); serving degraded results until the reset.")
+            self._exhausted = True
+            metrics.incr("cse_quota.daily_limit_429")
+            return
+        base = settings.cse_rate_limit_backoff_seconds
+        self._backoff = min(max(self._backoff * 2, base), base * 8)
+        self._backoff_until = time.monotonic() + max(retry_after or 0, self._backoff)
+        metrics.incr("cse_quota.rate_limit_429")
+
+    def record_success(self) -> None:
+        self._backoff = 0.0
+
+    def stats(self):
+        return {
+            "day": str(self._day) if self._day else None,
+            "daily_budget": self.daily_budget,
+            "used": self._used,
+            "remaining": max(self.daily_budget - self._used, 0),
+            "bucket_tokens": round(self._tokens, 2),
+            "bucket_size": round(self.burst, 2),
+            "exhausted": self._exhausted,
+            "backoff_seconds": round(max(self._backoff_until - time.monotonic(), 0), 1),
+            "seconds_until_reset": round(_seconds_until_reset()),
+            "queries_this_process": dict(self._queries),
+        }
+
+
+_manager = QuotaManager(
+    settings.cse_daily_query_budget, settings.cse_quota_burst, settings.cse_quota_pacing_factor, settings.api_workers
+)
+
+
+async def acquire(tool: str) -> None:
+    await _manager.acquire(tool)
+
+
+def record_429(daily_limit: bool, retry_after: Optional[float] = None) -> None:
+    _manager.record_429(daily_limit, retry_after)
+
+
+def record_success() -> None:
+    _manager.record_success()
+
+
+def is_daily_limit_error(body: dict) -> bool:
+    """True if a Google API 429 error body says the *daily* quota is spent (not the per-minute rate)."""
+    error = body.get("error") if isinstance(body, dict) else None
+    if not isinstance(error, dict):
+        return False
+    reasons = [item.get("reason", "") for item in error.get("errors", []) if isinstance(item, dict)]
+    limits = [str((item.get("metadata") or {}).get("quota_limit", "")) for item in error.get("details", [])
+              if isinstance(item, dict)]
+    text = " ".join([str(error.get("message", ""))] + reasons + limits).lower()
+    return "dailylimitexceeded" in text or "per day" in text or "perday" in text
+
+
+def stats():
+    return _manager.stats()
+
+
+metrics.register_collector("cse_quota", stats)
@@ -0,0 +1,108 @@
+# backend/sessions.py
+
+"""Keeps agent session history bounded.
+
+The agent only sends the last ``settings.agent_history_runs`` runs to Gemini.
+In addition, a background compactor trims the stored session rows. For each
+idle session whose stored ``memory`` exceeds ``settings.agent_history_token_budget``
+(estimated tokens), the oldest runs and messages are dropped. Each dropped user
+question is folded into a short rolling summary in ``session_data``, which
+``get_gemini_response`` puts into the prompt in place of the full history.
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Tuple
+
+from backend import metrics, database as db
+from backend.config import settings
+
+# Rough English/Indic average for Gemini tokenisation; good enough for budgeting.
+CHARS_PER_TOKEN = 4
+MAX_SUMMARY_LINES = 20
+
+_compactor = None
+
+
+def estimate_tokens(value: Any) -> int:
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    return len(text) // CHARS_PER_TOKEN
+
+
+def _user_text(entry: Dict[str, Any]) -> str:
+    """Best-effort extraction of the user's question from a stored run or message."""
+    message = entry.get("message") if isinstance(entry.get("message"), dict) else entry
+    if message.get("role", "user") != "user":
+        return ""
+    content = message.get("content")
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return " ".join(str(content or "").split())
+
+
+def compact_memory(memory: Dict[str, Any], summary: str, token_budget: int) -> Tuple[Dict[str, Any], str, int]:
+    """Drops the oldest runs/messages until ``memory`` fits the token budget.
+
+    Returns the compacted memory, the updated rolling summary and the number of
+    entries dropped.
+    """
+    dropped = 0
+    tokens = estimate_tokens(memory)
+    summary_lines: List[str] = [line for line in (summary or "").splitlines() if line.strip()]
+    for key in ("runs", "messages"):
+        entries = memory.get(key)
+        if not isinstance(entries, list):
+            continue
+        while entries and tokens > token_budget:
+            entry = entries.pop(0)
+            tokens -= estimate_tokens(entry)
+            question = _user_text(entry) if isinstance(entry, dict) else ""
+            line = f"- Earlier the farmer asked: {question[:160]}"
+            if question and line not in summary_lines:
+                summary_lines.append(line)
+            dropped += 1
+    return memory, "\n".join(summary_lines[-MAX_SUMMARY_LINES:]), dropped
+
+
+def compact_sessions() -> int:
+    """Compacts oversized idle sessions. Returns the number of sessions rewritten."""
+    budget = settings.agent_history_token_budget
+    idle_before = int(time.time()) - settings.session_compaction_idle_minutes * 60
+    compacted = 0
+    for session in db.get_sessions_to_compact(budget * CHARS_PER_TOKEN, idle_before, limit=200):
+        memory, summary, dropped = compact_memory(
+            session["memory"] or {}, session["history_summary"], budget
+        )
+        if dropped and db.update_session_memory(session["session_id"], memory, summary, idle_before):
+            compacted += 1
+            metrics.incr("sessions.entries_dropped", dropped)
+    metrics.incr("sessions.compacted", compacted)
+    return compacted
+
+
+async def _compactor_loop() -> None:
+    while True:
+        try:
+            started = time.monotonic()
+            compacted = await asyncio.to_thread(compact_sessions)
+            metrics.observe("sessions.compaction_seconds", time.monotonic() - started)
+            if compacted:
+                print(f"Compacted {compacted} agent sessions.")
+        except Exception as e:
+            print(f"Session compaction failed: {e}")
+        await asyncio.sleep(settings.session_compaction_interval_seconds)
+
+
+def start_compactor() -> None:
+    global _compactor
+    if _compactor is None and settings.session_compaction_interval_seconds > 0:
+        _compactor = asyncio.create_task(_compactor_loop())
+
+
+async def stop_compactor() -> None:
+    global _compactor
+    if _compactor is not None:
+        _compactor.cancel()
+        await asyncio.gather(_compactor, return_exceptions=True)
+        _compactor = None
@@ -1,9 +1,17 @@
-from google.cloud import translate_v2 as translate
+import json
+from functools import lru_cache
+from typing import List
 from .config import settings 
 
+@lru_cache(maxsize=1)
+def _translate_client():
+    # Imported lazily: the Cloud SDK is slow to import and only needed once a request arrives.
+    from google.cloud import translate_v2 as translate
+    return translate.Client()
+
 def translate_text(text: str, target_language: str) -> str:
     """Translates text to the target language using Google Cloud Translation."""
-    translate_client = translate.Client()
+    translate_client = _translate_client()
 
     if isinstance(text, bytes):
         text = text.decode("utf-8")
@@ -13,4 +21,35 @@ def translate_text(text: str, target_language: str) -> str:
         return result["translatedText"]
     except Exception as e:
         print(f"Error in translation: {e}")
-        raise
\ No newline at end of file
+        raise
+
+# The v2 API accepts up to 128 segments per request, and rejects request bodies over
+# 204,800 bytes; keep well under that, measured as the JSON the client sends.
+MAX_SEGMENTS_PER_REQUEST = 128
+MAX_BYTES_PER_REQUEST = 100 * 1024
+
+def _chunks(texts: List[str]):
+    """Splits ``texts`` into request-sized chunks by segment count and encoded size."""
+    chunk, size = [], 0
+    for text in texts:
+        text_size = len(json.dumps(text))
+        if chunk and (len(chunk) == MAX_SEGMENTS_PER_REQUEST or size + text_size > MAX_BYTES_PER_REQUEST):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(text)
+        size += text_size
+    if chunk:
+        yield chunk
+
+def translate_texts(texts: List[str], target_language: str) -> List[str]:
+    """Translates many texts to one target language in as few API calls as possible."""
+    translate_client = _translate_client()
+    translated = []
+    try:
+        for chunk in _chunks(texts):
+            results = translate_client.translate(chunk, target_language=target_language)
+            translated.extend(result["translatedText"] for result in results)
+        return translated
+    except Exception as e:
+        print(f"Error in batch translation: {e}")
+        raise
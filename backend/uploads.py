@@ -0,0 +1,188 @@
+# backend/uploads.py
+
+"""Bounded upload handling for voice and image files.
+
+Uploads are capped per type (``settings.max_audio_upload_bytes`` and
+``settings.max_image_upload_bytes``). ``UploadSizeLimitMiddleware`` rejects an
+oversized request from its Content-Length before any of the body is read,
+and stops a chunked request once it passes the same limit. As the body
+streams in, it also tracks each file part and stops the request as soon as
+one file passes the cap for its type, so an oversized image is never
+written to disk in full. The multipart
+parser spools each file part to a temporary file once it grows past
+``settings.upload_spool_threshold_bytes``. The endpoints then pass the spooled
+file handles down the pipeline. Nothing is read into memory until the
+upstream call that needs the bytes holds its admission slot. Peak memory
+therefore follows the upstream concurrency limits, not the number of
+open uploads.
+"""
+
+import os
+import re
+from typing import BinaryIO, Optional, Union
+
+from fastapi import HTTPException, UploadFile, status
+from fastapi.responses import JSONResponse
+from starlette.formparsers import MultiPartParser
+
+from backend import metrics
+from backend.config import settings
+
+# An upload is either raw bytes (job payloads loaded from Postgres) or a file handle.
+Media = Union[bytes, BinaryIO]
+
+UPLOAD_PATHS = ("/process-interaction/", "/jobs")
+FORM_OVERHEAD_BYTES = 64 * 1024  # text fields and multipart boundaries
+# Form field of each upload type on the upload endpoints.
+FILE_FIELDS = {"audio_file": "audio", "visual_file": "image"}
+_BOUNDARY = re.compile(rb'boundary="?([^";]+)"?', re.I)
+_FIELD_NAME = re.compile(rb'\bname="([^"]*)"', re.I)
+
+MultiPartParser.spool_max_size = settings.upload_spool_threshold_bytes
+
+
+def _limits():
+    return {"audio": settings.max_audio_upload_bytes, "image": settings.max_image_upload_bytes}
+
+
+def max_request_bytes() -> int:
+    return sum(_limits().values()) + FORM_OVERHEAD_BYTES
+
+
+def _too_large(what: str, limit: int) -> str:
+    return f"The {what} is too large. The limit is {limit / (1024 * 1024):.0f} MB."
+
+
+def media_size(media: Optional[Media]) -> int:
+    if media is None:
+        return 0
+    if isinstance(media, (bytes, bytearray, memoryview)):
+        return len(media)
+    position = media.tell()
+    media.seek(0, os.SEEK_END)
+    size = media.tell()
+    media.seek(position)
+    return size
+
+
+def read_media(media: Optional[Media]) -> Optional[bytes]:
+    """Returns the full content. Call this only where an SDK needs bytes, inside its admission slot."""
+    if media is None or isinstance(media, bytes):
+        return media
+    if isinstance(media, (bytearray, memoryview)):
+        return bytes(media)
+    media.seek(0)
+    return media.read()
+
+
+def open_upload(upload: Optional[UploadFile], kind: str) -> Optional[BinaryIO]:
+    """Checks an uploaded file against the cap for its ``kind`` ("audio" or "image").
+
+    Returns its spooled file handle, rewound, or None when no file was sent.
+    """
+    if upload is None or not upload.filename:
+        return None
+    size = upload.size if upload.size is not None else media_size(upload.file)
+    limit = _limits()[kind]
+    if size > limit:
+        metrics.incr(f"uploads.rejected.{kind}")
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=_too_large(f"{kind} file", limit))
+    if size == 0:
+        return None
+    metrics.observe(f"uploads.{kind}_bytes", size)
+    upload.file.seek(0)
+    return upload.file
+
+
+class _FilePartSizes:
+    """Follows a multipart body as it streams in and sizes each upload part by type.
+
+    Only the last few bytes are kept between chunks, so the memory used does
+    not depend on the upload size.
+    """
+
+    MAX_HEADER_BYTES = 16 * 1024
+
+    def __init__(self, boundary: bytes):
+        self.delimiter = b"\r\n--" + boundary
+        self.buffer = b"\r\n"  # the first delimiter has no CRLF before it
+        self.in_headers = False
+        self.kind = None
+        self.size = 0
+
+    def feed(self, chunk: bytes) -> Optional[str]:
+        """Returns the upload type whose part has just gone over its cap, if any."""
+        self.buffer += chunk
+        while True:
+            if self.in_headers:
+                end = self.buffer.find(b"\r\n\r\n")
+                if end < 0:
+                    if len(self.buffer) > self.MAX_HEADER_BYTES:
+                        self.in_headers, self.kind, self.buffer = False, None, b""
+                    return None
+                name = _FIELD_NAME.search(self.buffer[:end])
+                self.kind = FILE_FIELDS.get(name.group(1).decode("latin-1")) if name else None
+                self.size = 0
+                self.buffer = self.buffer[end + 4:]
+                self.in_headers = False
+                continue
+            end = self.buffer.find(self.delimiter)
+            # A delimiter may be split across chunks: hold back what could be its start.
+            consumed = end if end >= 0 else max(len(self.buffer) - len(self.delimiter) + 1, 0)
+            self.size += consumed
+            if self.kind is not None and self.size > _limits()[self.kind]:
+                return self.kind
+            if end < 0:
+                self.buffer = self.buffer[consumed:]
+                return None
+            self.buffer = self.buffer[end + len(self.delimiter):]
+            self.in_headers = True
+
+
+class UploadSizeLimitMiddleware:
+    """Rejects upload requests larger than the sum of the per-type caps, before reading them."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in UPLOAD_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        limit = max_request_bytes()
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            metrics.incr("uploads.rejected.content_length")
+            response = JSONResponse(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                content={"detail": _too_large("request", limit)},
+                headers={"Connection": "close"},
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+        boundary = _BOUNDARY.search(dict(scope["headers"]).get(b"content-type", b""))
+        parts = _FilePartSizes(boundary.group(1)) if boundary else None
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                received += len(body)
+                if received > limit:
+                    # No (or a false) Content-Length: stop reading once the limit is passed.
+                    metrics.incr("uploads.rejected.streamed")
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=_too_large("request", limit))
+                kind = parts.feed(body) if parts is not None else None
+                if kind is not None:
+                    # One file is over its own cap: stop before the rest of it is spooled.
+                    metrics.incr(f"uploads.rejected.{kind}")
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=_too_large(f"{kind} file", _limits()[kind])
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,81 @@
+# benchmarks/startup_time.py
+
+"""Cold-start benchmark for an API worker.
+
+Imports ``backend.main`` in fresh interpreters with ``-X importtime`` and
+reports the wall-clock import time plus the slowest modules by cumulative
+import time. Heavy SDKs (agno, Gemini, Google Cloud, pydub) should not show
+up at all: they are imported on first use.
+
+Run from the repository root with the backend's environment configured:
+
+    python benchmarks/startup_time.py --runs 5 --top 15
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ("agno", "google.generativeai", "google.cloud.speech", "google.cloud.texttospeech",
+                 "google.cloud.translate_v2", "pydub")
+
+
+def parse_importtime(stderr: str):
+    """Returns ``{module: (self_us, cumulative_us)}`` from ``-X importtime`` output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def run_once(module: str):
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        sys.exit(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+    return elapsed, parse_importtime(proc.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="backend.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    timings = []
+    modules = {}
+    for _ in range(args.runs):
+        elapsed, modules = run_once(args.module)
+        timings.append(elapsed)
+
+    print(f"Cold start of 'import {args.module}' over {args.runs} runs:")
+    print(f"  median {statistics.median(timings) * 1000:.0f} ms, "
+          f"min {min(timings) * 1000:.0f} ms, max {max(timings) * 1000:.0f} ms (process wall clock)")
+    if args.module in modules:
+        print(f"  import time of {args.module}: {modules[args.module][1] / 1000:.0f} ms cumulative")
+
+    print(f"\nSlowest {args.top} modules by cumulative import time (last run):")
+    slowest = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"  {cumulative_us / 1000:8.1f} ms  (self {self_us / 1000:6.1f} ms)  {name}")
+
+    eager = [name for name in modules if name.startswith(HEAVY_MODULES)]
+    if eager:
+        print(f"\nWARNING: heavy SDKs imported eagerly: {', '.join(sorted(eager)[:10])}")
+    else:
+        print("\nNo heavy SDKs imported at startup.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# benchmarks/upload_memory.py
+
+"""Peak-RSS benchmark for concurrent large uploads.
+
+Runs each mode in a fresh interpreter. It sends ``--concurrency`` uploads
+of ``--size-mb`` at once to a small app that uses the real
+``backend.uploads`` middleware and spooling. Each handler then waits for
+one of ``settings.stt_max_concurrency`` upstream slots and holds it for
+``--hold`` seconds, standing in for the STT call.
+
+* ``buffered`` reads every upload into memory on arrival, as the endpoint
+  did before.
+* ``spooled`` passes the spooled file handle along and reads it only
+  inside the slot, as ``pipeline.run_interaction`` does now.
+
+Run from the repository root with the backend's environment configured:
+
+    python benchmarks/upload_memory.py --concurrency 20 --size-mb 8
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ("buffered", "spooled")
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _build_app(mode: str, hold: float):
+    from fastapi import FastAPI, File, UploadFile
+
+    from backend import uploads
+    from backend.config import settings
+
+    app = FastAPI()
+    app.add_middleware(uploads.UploadSizeLimitMiddleware)
+    upstream = asyncio.Semaphore(settings.stt_max_concurrency)
+
+    @app.post("/process-interaction/")
+    async def interaction(audio_file: UploadFile = File(None)):
+        if mode == "buffered":
+            content = await audio_file.read()
+            async with upstream:
+                await asyncio.sleep(hold)
+        else:
+            handle = uploads.open_upload(audio_file, "audio")
+            async with upstream:
+                content = await asyncio.to_thread(uploads.read_media, handle)
+                await asyncio.sleep(hold)
+        return {"bytes": len(content)}
+
+    return app
+
+
+async def _run_child(mode: str, concurrency: int, size_mb: float, hold: float) -> dict:
+    import httpx
+
+    app = _build_app(mode, hold)
+    with tempfile.NamedTemporaryFile(suffix=".wav") as payload:
+        payload.write(os.urandom(int(size_mb * 1024 * 1024)))
+        payload.flush()
+        baseline = _rss_mb()
+
+        async def one(client):
+            with open(payload.name, "rb") as body:
+                response = await client.post("/process-interaction/", files={"audio_file": ("audio.wav", body, "audio/wav")})
+            return response.status_code
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            statuses = await asyncio.gather(*(one(client) for _ in range(concurrency)))
+
+    return {
+        "mode": mode,
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "statuses": dict(collections.Counter(statuses)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--size-mb", type=float, default=8)
+    parser.add_argument("--hold", type=float, default=0.5, help="seconds each request holds an upstream slot")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, ROOT)
+        print(json.dumps(asyncio.run(_run_child(args.child, args.concurrency, args.size_mb, args.hold))))
+        return
+
+    print(f"{args.concurrency} concurrent uploads of {args.size_mb:g} MB, {args.hold:g}s per upstream call:")
+    for mode in MODES:
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", mode, "--concurrency", str(args.concurrency),
+             "--size-mb", str(args.size_mb), "--hold", str(args.hold)],
+            capture_output=True, text=True, cwd=ROOT,
+        )
+        if proc.returncode != 0:
+            sys.exit(f"The {mode} run failed:\n{proc.stderr[-2000:]}")
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"  {mode:9s} peak RSS {result['peak_rss_mb']:7.1f} MB "
+              f"(+{result['peak_rss_mb'] - result['baseline_rss_mb']:.1f} MB over baseline)  "
+              f"statuses {result['statuses']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,19 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import base64
-from PIL import Image
+import io
+import zlib
+from PIL import Image, ImageOps
 from st_audiorec import st_audiorec
 import time
 
 # --- CONFIGURATION ---
 API_BASE_URL = "http://127.0.0.1:8000"
+HTTP_POOL_SIZE = 64          # keep-alive connections to the backend, shared by all sessions
+MAX_IMAGE_SIDE = 1280        # px; plenty for crop disease diagnosis
+IMAGE_JPEG_QUALITY = 80
+AUDIO_SAMPLE_RATE = 16000    # what speech recognition needs; the recorder captures 44.1 kHz stereo
 st.set_page_config(page_title="Project Kisan 🧑‍🌾", layout="centered", initial_sidebar_state="auto")
 
 # --- STYLING ---
@@ -32,6 +39,48 @@ if "processing_audio" not in st.session_state:
 if "last_audio_hash" not in st.session_state: 
     st.session_state.last_audio_hash = None
 
+@st.cache_resource
+def get_http_session():
+    """One pooled, keep-alive HTTP session for all Streamlit sessions in this process."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def shrink_image(visual_file):
+    """Downscales and re-encodes a photo as JPEG; returns (name, bytes, mime type) for upload."""
+    original = visual_file.getvalue()
+    try:
+        image = ImageOps.exif_transpose(Image.open(io.BytesIO(original)))
+        image.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE))
+        buffer = io.BytesIO()
+        image.convert("RGB").save(buffer, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    except Exception as e:
+        print(f"Could not shrink image, uploading the original: {e}")
+        return visual_file.name, original, visual_file.type
+    if buffer.tell() >= len(original):
+        return visual_file.name, original, visual_file.type
+    name = visual_file.name.rsplit(".", 1)[0] + ".jpg"
+    return name, buffer.getvalue(), "image/jpeg"
+
+def shrink_audio(wav_bytes):
+    """Downmixes a recording to 16 kHz mono 16-bit WAV, about a fifth of the recorder's output."""
+    try:
+        from pydub import AudioSegment
+        sound = AudioSegment.from_wav(io.BytesIO(wav_bytes))
+        sound = sound.set_channels(1).set_frame_rate(AUDIO_SAMPLE_RATE).set_sample_width(2)
+        buffer = io.BytesIO()
+        sound.export(buffer, format="wav")
+    except Exception as e:
+        print(f"Could not shrink audio, uploading the original: {e}")
+        return wav_bytes
+    return buffer.getvalue() if buffer.tell() < len(wav_bytes) else wav_bytes
+
+def audio_fingerprint(wav_bytes):
+    """Cheap change detection for recordings: the length plus a CRC of the last 4 KB."""
+    return len(wav_bytes), zlib.crc32(wav_bytes[-4096:])
+
 def make_api_call(audio_bytes=None, visual_file=None, text_query=""):
     user = st.session_state.user_info
     
@@ -44,19 +93,29 @@ def make_api_call(audio_bytes=None, visual_file=None, text_query=""):
             try:
                 files = {}
                 if audio_bytes: 
-                    files['audio_file'] = ('audio.wav', audio_bytes, 'audio/wav')
+                    files['audio_file'] = ('audio.wav', shrink_audio(audio_bytes), 'audio/wav')
                 if visual_file: 
-                    files['visual_file'] = (visual_file.name, visual_file.getvalue(), visual_file.type)
+                    files['visual_file'] = shrink_image(visual_file)
                 
                 user_location = f"{user['city']}, {user['district']}, {user['state']}"
                 data = {
                     "user_location": user_location, 
                     "language_name": user.get("language", "English"), 
                     "speak_aloud": user.get("speak_aloud", True), 
-                    "text_query": text_query or ""
+                    "text_query": text_query or "",
+                    "bandwidth_profile": "low" if user.get("low_data") else "standard"
                 }
+                if user.get("location_id"):
+                    data["location_id"] = user["location_id"]
+                if user.get("id") is not None:
+                    data["user_id"] = str(user["id"])
                 
-                response = requests.post(f"{API_BASE_URL}/process-interaction/", files=files, data=data, timeout=180)
+                response = get_http_session().post(f"{API_BASE_URL}/process-interaction/", files=files, data=data, timeout=180)
+                if response.status_code in (429, 503):
+                    retry_after = response.headers.get("Retry-After", "a few")
+                    st.warning(f"Kisan Mitra is busy right now. Please try again in {retry_after} seconds.")
+                    st.session_state.messages.append({"role": "assistant", "text": "The service is busy right now. Please try again shortly."})
+                    return
                 response.raise_for_status()
                 result = response.json()
                 
@@ -72,7 +131,8 @@ def make_api_call(audio_bytes=None, visual_file=None, text_query=""):
                 
                 audio_b64 = result.get("audio_output_b64")
                 if audio_b64 and user.get("speak_aloud"):
-                    st.session_state.autoplay_audio = f'<audio class="hidden-audio" autoplay><source src="data:audio/mp3;base64,{audio_b64}" type="audio/mp3"></audio>'
+                    mime_type = result.get("audio_mime_type") or "audio/mpeg"
+                    st.session_state.autoplay_audio = f'<audio class="hidden-audio" autoplay><source src="data:{mime_type};base64,{audio_b64}" type="{mime_type}"></audio>'
                 
                 st.session_state.processing_audio = False
                 st.rerun()
@@ -98,7 +158,7 @@ def show_login_page():
                 st.error("Please enter both username and password.")
             else:
                 try:
-                    response = requests.post(
+                    response = get_http_session().post(
                         f"{API_BASE_URL}/login",
                         data={"username": name, "password": password}
                     )
@@ -139,7 +199,7 @@ def show_register_page():
                     "city": city, "password": password
                 }
                 try:
-                    response = requests.post(f"{API_BASE_URL}/register", json=user_data)
+                    response = get_http_session().post(f"{API_BASE_URL}/register", json=user_data)
                     if response.status_code == 201:
                         st.success("Registration successful! Please log in.")
                         st.session_state.page = "login"
@@ -169,6 +229,7 @@ def show_chat_page():
             "Telugu (తెలుగు)", "Malayalam (മലയാളം)", "Bengali (বাংলা)"
         ])
         st.session_state.user_info["speak_aloud"] = st.checkbox("Speak response aloud", value=True)
+        st.session_state.user_info["low_data"] = st.checkbox("Low data mode", value=False, help="Smaller, compressed responses for slow (2G/3G) connections.")
         st.markdown("---")
         
         st.subheader("Upload a Photo")
@@ -179,7 +240,7 @@ def show_chat_page():
         if not st.session_state.processing_audio:
             wav_audio_data = st_audiorec()
             if wav_audio_data is not None:
-                audio_hash = hash(wav_audio_data)
+                audio_hash = audio_fingerprint(wav_audio_data)
                 if audio_hash != st.session_state.last_audio_hash:
                     st.session_state.last_audio_hash = audio_hash
                     st.session_state.processing_audio = True
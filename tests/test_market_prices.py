@@ -0,0 +1,86 @@
+from datetime import date
+
+from backend import market_prices
+
+TODAY = date(2026, 10, 19)
+NASHIK = "in-mh/nashik"
+
+
+def parse(text, crop="onion", market=NASHIK):
+    return market_prices.parse_price_snippet(text, crop, market, "https://example.com", TODAY)
+
+
+def test_labelled_prices():
+    record = parse("Onion price in Nashik mandi on 18-10-2026: Min price Rs 1,800, Max price Rs 2,600, Modal price Rs 2,200")
+    assert record.crop == "onion"
+    assert record.market == NASHIK
+    assert record.price_date == date(2026, 10, 18)
+    assert (record.min_price, record.max_price, record.modal_price) == (1800, 2600, 2200)
+
+
+def test_modal_derived_from_min_and_max():
+    record = parse("Nasik onion rates, 17 Oct 2026. Minimum: 1000, Maximum: 1400")
+    assert record.modal_price == 1200
+
+
+def test_per_kg_converted_to_quintal():
+    record = parse("Onion sells at ₹24/kg in Nashik market (Oct 18, 2026)")
+    assert record.modal_price == 2400
+
+
+def test_undated_snippet_skipped():
+    assert parse("Onion price in Nashik: Modal price Rs 2,200") is None
+
+
+def test_out_of_range_date_ignored():
+    assert parse("Onion price in Nashik on 18-10-2020: Modal price Rs 2,200") is None
+
+
+def test_other_crop_skipped():
+    assert parse("Tomato prices in Nashik 18-10-2026: min 800 max 1200") is None
+
+
+def test_other_market_skipped():
+    assert parse("Onion prices in Pune 18-10-2026: min 800 max 1200") is None
+    assert parse("Lasalgaon onion auction 18-10-2026: modal price Rs 2,000") is None
+
+
+def test_support_price_skipped():
+    assert parse("Nashik onion farmers demand MSP of Rs 3,000, 18-10-2026") is None
+    assert parse("Minimum support price for onion in Nashik: Rs 3,000 (18-10-2026)") is None
+
+
+def test_unlisted_district_key():
+    record = market_prices.parse_price_snippet(
+        "Sitapur mandi potato modal price Rs 900 on 2026-10-18", "potato", "in-up/sitapur", today=TODAY
+    )
+    assert record.market == "in-up/sitapur"
+    assert record.modal_price == 900
+
+
+def test_parse_search_items_uses_title_and_snippet():
+    items = [
+        {"title": "Onion Price Today in Nashik", "snippet": "18 Oct 2026 modal price Rs 2,150", "link": "a"},
+        {"title": "Onion Price Today", "snippet": "No prices listed.", "link": "b"},
+    ]
+    records = market_prices.parse_search_items(items, "Onion", NASHIK, TODAY)
+    assert [(r.source_url, r.modal_price) for r in records] == [("a", 2150)]
+
+
+def test_summarize_trend():
+    rows = [
+        {"price_date": date(2026, 10, 1), "modal_price": 2000},
+        {"price_date": date(2026, 10, 5), "modal_price": None},
+        {"price_date": date(2026, 10, 9), "modal_price": 1800},
+        {"price_date": date(2026, 10, 18), "modal_price": 2500},
+    ]
+    trend = market_prices.summarize_trend(rows)
+    assert trend["points"] == 3
+    assert (trend["from_date"], trend["to_date"]) == ("2026-10-01", "2026-10-18")
+    assert trend["change"] == 500
+    assert trend["change_percent"] == 25.0
+    assert (trend["lowest"], trend["highest"]) == (1800, 2500)
+
+
+def test_summarize_trend_without_prices():
+    assert market_prices.summarize_trend([{"price_date": date(2026, 10, 1), "modal_price": None}]) == {"points": 0}